@@ -2765,6 +2765,18 @@ class OptimizerConfig(BaseConfig):
 
         - cpu_offload (bool): The process of optimizer will be offload to host. The gradients, parameters and
           optimizer status will be offload to host. Default: Flase.
+
+        - use_fused_kernel (bool): Update parameters and moments with the fused AdamWeightDecay kernel.
+          Default: False.
+
+        - moments_dtype (str): Data type of the first and second moments, one of `float32`, `bfloat16` and
+          `float16`. Default: float32.
+
+        - overlap_grad_reduce (bool): Overlap the gradient reduce of parameter hooks with backward propagation.
+          Default: False.
+
+        - jit_update (bool): Run the unfused update as a compiled graph specialized per parameter shape.
+          Default: False.
         end_weight_decay (float): End weight decay. Default: 0.0.
         lr_decay_iters (int): Number of iterations to decay learning rate. Default: None.
         lr_decay_samples (int): Number of samples to decay learning rate. Default: None.
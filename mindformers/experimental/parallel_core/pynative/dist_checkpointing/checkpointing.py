@@ -375,6 +375,9 @@ def load_checkpoint(config, model, optimizer=None, opt_param_scheduler=None, ckp
                 logger.warning(f"When loading ckpt into the optimizer, param_not_load:{param_not_load}")
             if ckpt_not_load:
                 logger.warning(f"When loading ckpt into the optimizer, ckpt_not_load:{ckpt_not_load}")
+            if hasattr(optimizer, "reset_host_step"):
+                # the optimizer keeps a host copy of global_step, which is stale after loading
+                optimizer.reset_host_step()
 
     logger.info(f"Checkpoint: {src_ckpt_file} is loaded successfully!")
 
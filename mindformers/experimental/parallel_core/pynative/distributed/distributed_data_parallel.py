@@ -13,7 +13,6 @@
 # limitations under the License.
 # ============================================================================
 """ Distributed data parallel wrapper. """
-from contextlib import contextmanager
 from collections import deque
 from mindspore import mint, ops, _no_grad, Parameter
 from mindspore.common.initializer import Zero
@@ -60,6 +59,20 @@ def wait_grad(param, wait_grad_buffer):
     param.full_grad = None
 
 
+class _NoSync:
+    """ context manager which disables grad sync by flipping the flag shared by all buffers. """
+    __slots__ = ('sync_flag',)
+
+    def __init__(self, sync_flag):
+        self.sync_flag = sync_flag
+
+    def __enter__(self):
+        self.sync_flag[0] = False
+
+    def __exit__(self, *args):
+        self.sync_flag[0] = True
+
+
 def set_model_fw_bw_hook(network, grad_reduce_in_fp32, average_in_collective):
     ''' register fw bw hook for the zero3 params '''
     wait_buffer = deque()
@@ -254,6 +267,9 @@ class DistributedDataParallel(Module):
         self.module = module
         self.param_to_buffer = {}
         self.zero3_param = []
+        self.params_with_grad = []
+        # shared by all buffers, see `no_sync`
+        self.sync_flag = [True]
         if ddp_config.use_zero3:
             if get_pipeline_model_parallel_world_size() > 1:
                 raise RuntimeError(f"DDP ZeRO3 is not compatible with pipeline parallel. "
@@ -280,6 +296,7 @@ class DistributedDataParallel(Module):
             param.main_grad = None
 
             param.grad_accumulated = False
+            self.params_with_grad.append(param)
             if hasattr(param, 'use_zero3') and param.use_zero3:
                 grad_dtype = mstype.float32 if self.ddp_config.grad_reduce_in_fp32 else param.dtype
                 param.grad = ops.Tensor(shape=param.shape, dtype=grad_dtype, init=Zero())
@@ -341,6 +358,7 @@ class DistributedDataParallel(Module):
                     bucket_size=self.bucket_size,
                     param_to_name=None,
                     gradient_scaling_factor=gradient_scaling_factor,
+                    sync_flag=self.sync_flag,
                 )
             )
             for param in params:
@@ -376,9 +394,9 @@ class DistributedDataParallel(Module):
 
     def zero_grad_buffer(self):
         """ reset buffers for the next train iteration. """
-        for param in self.module.get_parameters():
-            if param.requires_grad:
-                param.grad_accumulated = False
+        # params requiring grad are collected once at init, avoid traversing the cell tree every iteration
+        for param in self.params_with_grad:
+            param.grad_accumulated = False
         for buffer in self.buffers + self.expert_parallel_buffers:
             buffer.reset()
         for param in self.zero3_param:
@@ -386,17 +404,11 @@ class DistributedDataParallel(Module):
 
     def enable_sync(self, enable):
         """ enable grad buffer sync or not. """
-        for buffer in self.buffers + self.expert_parallel_buffers:
-            buffer.sync_enabled = enable
+        self.sync_flag[0] = enable
 
-    @contextmanager
     def no_sync(self):
         """ context manager helper function. """
-        self.enable_sync(False)
-        try:
-            yield
-        finally:
-            self.enable_sync(True)
+        return _NoSync(self.sync_flag)
 
     def _make_param_hook(
             self,
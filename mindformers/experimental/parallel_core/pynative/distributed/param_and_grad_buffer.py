@@ -84,6 +84,9 @@ class Bucket:
             self.grad_reducer = comm_func.reduce_scatter_tensor \
                                 if self.ddp_config.use_distributed_optimizer \
                                 else comm_func.all_reduce
+        # hccl has no average reduce op, so the mean is applied while copying the reduced result back.
+        self.average_scale = 1.0 / self.data_parallel_world_size \
+                             if self.ddp_config.average_in_collective else 1.0
         self.reset()
 
     def inplace_reduce_dp(self, src):
@@ -128,20 +131,22 @@ class Bucket:
         if not self.ddp_config.overlap_grad_reduce:
             self.issue_grad_reduce()
             if self.data_parallel_world_size > 1:
-                target.copy_(self.communication_result)
-                self.communication_result = None
-                if self.ddp_config.average_in_collective:
-                    target.copy_(mint.div(target, self.data_parallel_world_size))
+                self._copy_reduce_result(target)
             return
         if not self.is_reduce_issued:
             raise RuntimeError(f"The bucket reduce has not been issued "
                                f"with only {len(self.params_grad_ready)}/{len(self.params)} params ready")
         if self.data_parallel_world_size > 1:
             self.communication_handle.wait()
+            self._copy_reduce_result(target)
+
+    def _copy_reduce_result(self, target):
+        """ copy communication result into target, folding the collective average into the same pass. """
+        if self.average_scale != 1.0:
+            target.copy_(mint.mul(self.communication_result, self.average_scale))
+        else:
             target.copy_(self.communication_result)
-            self.communication_result = None
-            if self.ddp_config.average_in_collective:
-                target.copy_(mint.div(target, self.data_parallel_world_size))
+        self.communication_result = None
 
     def register_grad_ready(self, param):
         """ register grad ready and issue bucket grad reduce when the bucket is ready. """
@@ -173,6 +178,8 @@ class ParamAndGradBuffer:
         params (List(Parameters)): Parameters belongs to this buffer.
         data_parallel_group (str): Data parallel group name.
         bucket_size (int): Bucket size threshold used to partition bucekts.
+        sync_flag (list): Single-element list holding the grad sync switch. Buffers of the same
+            DistributedDataParallel share one flag so that it can be toggled in O(1). Default: None.
     """
     # pylint: disable=W0613
     def __init__(
@@ -185,6 +192,7 @@ class ParamAndGradBuffer:
             bucket_size,
             param_to_name,
             gradient_scaling_factor,
+            sync_flag=None,
         ):
         super(ParamAndGradBuffer, self).__init__()
         self.param_dtype = param_dtype
@@ -197,7 +205,8 @@ class ParamAndGradBuffer:
         self.param_index_map = {}
         self.ddp_config = ddp_config
         self.param_to_bucket = {}
-        self.sync_enabled = True
+        # the flag may be shared with buffers created earlier, keep its current state
+        self.sync_flag = sync_flag if sync_flag is not None else [True]
 
         shard_num = 1 if not self.ddp_config.use_distributed_optimizer else self.data_parallel_world_size
 
@@ -331,6 +340,15 @@ class ParamAndGradBuffer:
             if not self.ddp_config.use_distributed_optimizer:
                 param.grad = param.main_grad
 
+    @property
+    def sync_enabled(self):
+        """ whether grad reduce is triggered when grads are ready. """
+        return self.sync_flag[0]
+
+    @sync_enabled.setter
+    def sync_enabled(self, enable):
+        self.sync_flag[0] = enable
+
     def _get_buffer_slice(self, shape, start_index, buffer_type):
         """ get the buffer view with the same shape """
         end_index = start_index + int(np.prod(shape))
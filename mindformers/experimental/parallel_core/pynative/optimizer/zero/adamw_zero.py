@@ -16,9 +16,10 @@
 
 __all__ = ["AdamW"]
 
+import math
 import numpy as np
 import mindspore as ms
-from mindspore import ParameterTuple, Tensor, ops, nn, _no_grad, mint
+from mindspore import ParameterTuple, Tensor, ops, nn, _no_grad, mint, jit, JitConfig
 import mindspore._checkparam as validator
 from mindspore.ops import operations as P
 from mindspore.ops import functional as F
@@ -33,39 +34,100 @@ from mindformers.tools import logger
 from mindformers.experimental.parallel_core.pynative.register import ModuleType, ModuleRegistry
 
 _adamw_opt = ops.MultitypeFuncGraph("adamw_opt")
+_fused_adamw_opt = ops.MultitypeFuncGraph("fused_adamw_opt")
+_jit_adamw_opt = ops.MultitypeFuncGraph("jit_adamw_opt")
 _split_params = ops.MultitypeFuncGraph("split_params")
-_update_params = ops.MultitypeFuncGraph("update_params")
 
+_MOMENTS_DTYPE = {"float32": mstype.float32, "bfloat16": mstype.bfloat16, "float16": mstype.float16}
 
-@_adamw_opt.register("Function", "Function", "Function", "Function", "Function", "Tensor", "Tensor",
+# max numel of the gathered result of one flattened all-gather bucket
+ALL_GATHER_BUCKET_SIZE = 40000000
+
+
+@_adamw_opt.register("Function", "Function", "Function", "Function", "Function", "Tensor", "Tensor", "Tensor",
                      "Tensor", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor")
-def _update_by_opt(op_mul, op_pow, op_sqrt, addcmul, op_cast, beta1, beta2, eps, step, lr,
-                   weight_decay, parameters, grads, exp_avg, exp_avg_sq):
+def _update_by_opt(op_mul, op_sqrt, addcmul, op_lerp, op_cast, beta2, one_minus_beta1, one_minus_beta2, eps,
+                   bias_correction2, decay_coef, step_size, parameters, grads, exp_avg, exp_avg_sq):
     """
-    Apply AdamWeigthDecay operator to update parameters.
+    Apply AdamWeigthDecay operator to update parameters. Moments may be stored in low precision,
+    the math is always done in float32.
+
+    `decay_coef` (1 - lr * weight_decay), `step_size` (lr / bias_correction1) and the other scalars
+    are the same for every parameter of a group, they are computed once per step by the optimizer.
     """
     param_fp32 = op_cast(parameters, mstype.float32)
-    next_param = op_mul(param_fp32, 1 - lr * weight_decay)
+    next_param = op_mul(param_fp32, decay_coef)
     gradient_fp32 = op_cast(grads, mstype.float32)
-    one = op_cast(F.tuple_to_array((1.0,)), mstype.float32)
-    exp_avg_update = op_mul(exp_avg, beta1) + op_mul(gradient_fp32,
-                                                     one - beta1)
-    F.assign(exp_avg, exp_avg_update)
-    exp_avg_sq_update = addcmul(op_mul(exp_avg_sq, beta2),
+    moments_fp32 = F.dtype(exp_avg) == mstype.float32
+    exp_avg_fp32 = exp_avg if moments_fp32 else op_cast(exp_avg, mstype.float32)
+    exp_avg_sq_fp32 = exp_avg_sq if moments_fp32 else op_cast(exp_avg_sq, mstype.float32)
+    # beta1 * m + (1 - beta1) * g in a single kernel
+    exp_avg_update = op_lerp(exp_avg_fp32, gradient_fp32, one_minus_beta1)
+    exp_avg_sq_update = addcmul(op_mul(exp_avg_sq_fp32, beta2),
                                 gradient_fp32,
                                 gradient_fp32,
-                                one - beta2)
-    F.assign(exp_avg_sq, exp_avg_sq_update)
-    bias_correction1 = 1 - op_pow(op_cast(beta1, mstype.float32), step)
-    bias_correction2 = 1 - op_pow(op_cast(beta2, mstype.float32), step)
-    step_size = lr / bias_correction1
-
-    denom = op_sqrt(exp_avg_sq / bias_correction2) + eps
-    return_param = next_param - op_mul(exp_avg / denom, step_size)
+                                one_minus_beta2)
+    if moments_fp32:
+        F.assign(exp_avg, exp_avg_update)
+        F.assign(exp_avg_sq, exp_avg_sq_update)
+    else:
+        F.assign(exp_avg, op_cast(exp_avg_update, F.dtype(exp_avg)))
+        F.assign(exp_avg_sq, op_cast(exp_avg_sq_update, F.dtype(exp_avg_sq)))
+
+    denom = op_sqrt(exp_avg_sq_update / bias_correction2) + eps
+    return_param = next_param - op_mul(exp_avg_update / denom, step_size)
     return_param = op_cast(return_param, F.dtype(parameters))
     return return_param
 
 
+@_fused_adamw_opt.register("Function", "Function", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor",
+                           "Tensor", "Tensor", "Tensor")
+def _update_by_fused_opt(opt, op_cast, beta1, beta2, eps, lr, decay, parameters, grads, exp_avg, exp_avg_sq):
+    """
+    Apply AdamWeigthDecay operator to update parameters with a single fused kernel.
+
+    The fused kernel has no bias correction, it is folded into the per-step scalars instead:
+    `lr * sqrt(bc2) / bc1` as learning rate, `eps * sqrt(bc2)` as epsilon and `wd * bc1 / sqrt(bc2)`
+    as decay, which gives exactly the same update as `_update_by_opt`.
+    """
+    next_param = opt(parameters, exp_avg, exp_avg_sq, lr, beta1, beta2, eps, decay,
+                     op_cast(grads, F.dtype(parameters)))
+    return F.depend(parameters, next_param)
+
+
+@jit(jit_config=JitConfig(jit_level="O2"))
+def _adamw_step_graph(beta2, one_minus_beta1, one_minus_beta2, eps, bias_correction2, decay_coef, step_size,
+                      parameters, grads, exp_avg, exp_avg_sq):
+    """
+    Graph compiled version of `_update_by_opt`. The graph is compiled and cached by mindspore for each
+    distinct shape and dtype of the inputs, so every parameter shape gets its own specialized kernels,
+    with the elementwise chain fused by the graph compiler.
+    """
+    param_fp32 = ops.cast(parameters, mstype.float32)
+    gradient_fp32 = ops.cast(grads, mstype.float32)
+    exp_avg_update = ops.lerp(ops.cast(exp_avg, mstype.float32), gradient_fp32, one_minus_beta1)
+    exp_avg_sq_update = ops.addcmul(ops.cast(exp_avg_sq, mstype.float32) * beta2,
+                                    gradient_fp32,
+                                    gradient_fp32,
+                                    one_minus_beta2)
+    F.assign(exp_avg, ops.cast(exp_avg_update, F.dtype(exp_avg)))
+    F.assign(exp_avg_sq, ops.cast(exp_avg_sq_update, F.dtype(exp_avg_sq)))
+    denom = ops.sqrt(exp_avg_sq_update / bias_correction2) + eps
+    return_param = param_fp32 * decay_coef - exp_avg_update / denom * step_size
+    return ops.cast(return_param, F.dtype(parameters))
+
+
+@_jit_adamw_opt.register("Tensor", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor", "Tensor",
+                         "Tensor", "Tensor")
+def _update_by_jit_opt(beta2, one_minus_beta1, one_minus_beta2, eps, bias_correction2, decay_coef, step_size,
+                       parameters, grads, exp_avg, exp_avg_sq):
+    """
+    Apply AdamWeigthDecay update to parameters with the graph compiled `_adamw_step_graph`.
+    """
+    return _adamw_step_graph(beta2, one_minus_beta1, one_minus_beta2, eps, bias_correction2, decay_coef, step_size,
+                             parameters, grads, exp_avg, exp_avg_sq)
+
+
 @_split_params.register("Number", "Function", "Tensor", "Bool")
 def _split_params_to_fp32(shard_id, split, param, need_split):
     """
@@ -80,33 +142,23 @@ def _split_params_to_fp32(shard_id, split, param, need_split):
     return splited_param
 
 
-@_update_params.register("String", "Tensor", "Tensor", "bool")
-def _update_params_opt_parallel(group, param, update, all_gather):
+def _inner_grad_reduce_scatter(dp_cp_group, grad_allreduce_sum, grad_mean_scale, grads, reduce_scatter):
     """
-    Allgather updated parameters and load.
+    Reduce gradients. Gradients of parameters whose status is not splited are all-reduced,
+    since their optimizer status and update are not sharded. The collectives have no average
+    op, so the mean is taken by multiplying with `grad_mean_scale` (1 / shard_size).
     """
-    if all_gather:
-        update = comm_func.all_gather_into_tensor(update, group=group)[0]
-    if update.dtype != param.dtype:
-        update = ops.cast(update, param.dtype)
-    param.assign_value(update)
-
-
-def _inner_grad_reduce_scatter(dp_cp_group, grad_allreduce_sum, shard_size, grads, grads_splited,
-                               parameter_splited):
-    """
-    Reduce gradients.
-    """
-    if grads_splited or parameter_splited:
+    if reduce_scatter:
         grads = comm_func.reduce_scatter_tensor(grads, group=dp_cp_group)[0]
     else:
         grads = comm_func.all_reduce(grads, group=dp_cp_group)[0]
     if not grad_allreduce_sum:
-        grads = mint.div(grads, shard_size)
+        grads = mint.mul(grads, grad_mean_scale)
     return grads
 
 
-def _check_param_value(beta1, beta2, eps, opt_parallel_group, cpu_offload, param_resident_rate, prim_name):
+def _check_param_value(beta1, beta2, eps, opt_parallel_group, cpu_offload, param_resident_rate, moments_dtype,
+                       prim_name):
     """Check the type of inputs."""
     validator.check_value_type("beta1", beta1, [float], prim_name)
     validator.check_value_type("beta2", beta2, [float], prim_name)
@@ -117,6 +169,7 @@ def _check_param_value(beta1, beta2, eps, opt_parallel_group, cpu_offload, param
     validator.check_float_range(beta1, 0.0, 1.0, validator.INC_NEITHER, "beta1", prim_name)
     validator.check_float_range(beta2, 0.0, 1.0, validator.INC_NEITHER, "beta2", prim_name)
     validator.check_positive_float(eps, "eps", prim_name)
+    validator.check_string(moments_dtype, list(_MOMENTS_DTYPE.keys()), "moments_dtype", prim_name)
 
 
 @ModuleRegistry.register_decorator(ModuleType.OPTIMIZER, "AdamWZeRO")
@@ -203,6 +256,21 @@ class AdamW(Optimizer):
         cpu_offload (bool): The process of optimizer will be offload to host. The gradients, parameters and optimizer
             status will be offload to host. Default: Flase.
 
+        use_fused_kernel (bool): Update parameters and moments with the fused AdamWeightDecay kernel instead of a
+            chain of elementwise operators. Default: False.
+
+        moments_dtype (str): Data type to store the first and second moments, one of `float32`, `bfloat16` and
+            `float16`. Low precision moments halve the optimizer states memory, the update math is still done in
+            float32. The fused kernel only supports float32 moments, so it is disabled otherwise. Default: float32.
+
+        overlap_grad_reduce (bool): Launch the gradient reduce of parameter hooks asynchronously so that it overlaps
+            with the rest of backward propagation. The optimizer waits for it before the update, `wait_grad_reduce`
+            can be called earlier if gradients are used before that. Default: False.
+
+        jit_update (bool): Run the unfused update of each parameter as a compiled graph, which is specialized and
+            cached by mindspore for every distinct parameter shard shape and dtype. Only takes effect when the fused
+            kernel is not used and `cpu_offload` is False. Default: False.
+
     Inputs:
         - **gradients** (tuple[Tensor]) - The gradients of `params`, the shape is the same as `params`.
 
@@ -228,10 +296,12 @@ class AdamW(Optimizer):
     def __init__(self, network, params, learning_rate=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0.0,
                  zero_level="z1", param_resident=False, param_resident_rate=1.0,
                  allreduce_after_grad_accumulation=False, grad_allreduce_op="sum", opt_parallel_group=None,
-                 cpu_offload=False, with_context_parallel=False):
+                 cpu_offload=False, with_context_parallel=False, use_fused_kernel=False, moments_dtype="float32",
+                 overlap_grad_reduce=False, jit_update=False):
         super(AdamW, self).__init__(learning_rate, params, weight_decay)
         beta1, beta2 = betas
-        _check_param_value(beta1, beta2, eps, opt_parallel_group, cpu_offload, param_resident_rate, self.cls_name)
+        _check_param_value(beta1, beta2, eps, opt_parallel_group, cpu_offload, param_resident_rate, moments_dtype,
+                           self.cls_name)
         if grad_allreduce_op not in ["mean", "sum"]:
             raise NotImplementedError(f"{grad_allreduce_op} is not supported in AdamWeightDecay yet.")
         if zero_level not in ["z2", "z3"] and allreduce_after_grad_accumulation is True:
@@ -240,6 +310,13 @@ class AdamW(Optimizer):
             logger.warning(f"param_resident must be False when in {zero_level}")
         if param_resident is True and (param_resident_rate > 1 or param_resident_rate <= 0):
             raise NotImplementedError(f"When use param_resident, param_resident_rate must in (0, 1]")
+        if use_fused_kernel and moments_dtype != "float32":
+            logger.warning(f"use_fused_kernel only supports float32 moments, "
+                           f"it will be disabled for moments_dtype {moments_dtype}")
+            use_fused_kernel = False
+        if jit_update and cpu_offload:
+            logger.warning("jit_update does not support cpu_offload, it will be disabled")
+            jit_update = False
         self.network = network
         self.zero_level = zero_level
         self.cpu_offload = cpu_offload
@@ -247,10 +324,14 @@ class AdamW(Optimizer):
         self.param_resident_rate = param_resident_rate
         self.allreduce_after_grad_accumulation = allreduce_after_grad_accumulation
         self.with_context_parallel = with_context_parallel
+        self.use_fused_kernel = use_fused_kernel
+        self.moments_dtype = _MOMENTS_DTYPE[moments_dtype]
+        self.overlap_grad_reduce = overlap_grad_reduce
+        self.jit_update = jit_update
+        self._grad_reduce_handles = []
         self.grad_allreduce_sum = grad_allreduce_op == "sum"
         self._parameter_splited = [False] * len(self._parameters)
         self._status_splited = [False] * len(self._parameters)
-        self.all_gather_ops = [False] * len(self._parameters)
         # init communication group info
         self._init_optimizer_shard_info()
 
@@ -262,14 +343,22 @@ class AdamW(Optimizer):
         if self.zero_level == "z3":
             self._regist_hook_for_cells()
         self._parameter_status_split()
+        self._grad_reduce_scatter = tuple(param_splited or status_splited for param_splited, status_splited
+                                          in zip(self._parameter_splited, self._status_splited))
         if not self.allreduce_after_grad_accumulation:
             self._regist_hook_for_params()
-        self._init_all_gather_ops()
-        self.all_gather_ops = tuple(self.all_gather_ops)
+        self.all_gather_ops = self._init_all_gather_ops()
         self.beta1 = Tensor(np.array([beta1]).astype(np.float32))
         self.beta2 = Tensor(np.array([beta2]).astype(np.float32))
         self.eps = Tensor(np.array([eps]).astype(np.float32))
-
+        self.one_minus_beta1 = Tensor(np.array([1.0 - beta1]).astype(np.float32))
+        self.one_minus_beta2 = Tensor(np.array([1.0 - beta2]).astype(np.float32))
+        # host copies for the per-step bias corrections
+        self._betas = (beta1, beta2)
+        self._eps = eps
+        self._host_step = None
+
+        self._status_shapes = None
         self.moments1 = self._init_momentum(self._parameters, prefix="adam_m", init="zeros")
         self.moments2 = self._init_momentum(self._parameters, prefix="adam_v", init="zeros")
 
@@ -277,42 +366,45 @@ class AdamW(Optimizer):
             "beta1": self.beta1, "beta2": self.beta2, "eps": self.eps,
             "moments1": self.moments1, "moments2": self.moments2
         }
+        self._opt_params_offloaded = False
         self.op_mul = P.Mul()
-        self.op_pow = P.Pow()
         self.op_sqrt = P.Sqrt()
         self.op_maximum = P.Maximum()
         self.addcmul = P.Addcmul()
+        self.op_lerp = P.Lerp()
         self.op_cast = P.Cast()
+        self.fused_opt = P.AdamWeightDecay()
         if self.cpu_offload:
             self.op_mul.set_device("CPU")
-            self.op_pow.set_device("CPU")
             self.op_sqrt.set_device("CPU")
             self.op_maximum.set_device("CPU")
             self.addcmul.set_device("CPU")
+            self.op_lerp.set_device("CPU")
             self.op_cast.set_device("CPU")
+            self.fused_opt.set_device("CPU")
 
     def _init_optimizer_shard_info(self):
         """Init optimizer parallel information."""
         self.shard_size = get_data_parallel_world_size(with_context_parallel=self.with_context_parallel)
         self.shard_id = get_data_parallel_rank(with_context_parallel=self.with_context_parallel)
+        # the collectives have no average op, mean reduction multiplies the sum by this scale
+        self.grad_mean_scale = 1.0 / self.shard_size
 
     def _init_all_gather_ops(self):
-        for i, param_splited in enumerate(self._status_splited):
-            if param_splited:
-                self.all_gather_ops[i] = True
+        """Params with splited status are updated by shard and need to be all-gathered."""
+        return tuple(self._status_splited)
 
     def _param_resident_flag(self, zero3_param_numel, param_resident_rate):
-        """add resident flag"""
-        total_numel = sum(zero3_param_numel.values())
-        zero3_param_numel = sorted(zero3_param_numel.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)
-        numel_count = 0
-        resident_cell_id = []
-        for param_numel in zero3_param_numel:
-            numel_count += param_numel[1]
-            resident_cell_id.append(param_numel[0])
-            if numel_count >= total_numel * param_resident_rate:
-                break
-        return resident_cell_id
+        """
+        add resident flag, the largest cells are resident until their numel reaches
+        `param_resident_rate` of the total. `zero3_param_numel` is the numel array indexed by cell id.
+        """
+        cell_ids = np.arange(len(zero3_param_numel))
+        # descending by numel, ties broken by the larger cell id
+        order = np.lexsort((-cell_ids, -zero3_param_numel))
+        numel_count = np.cumsum(zero3_param_numel[order])
+        resident_num = int(np.searchsorted(numel_count, numel_count[-1] * param_resident_rate, side="left")) + 1
+        return set(order[:resident_num].tolist())
 
 
     def _regist_hook_for_cells(self):
@@ -321,19 +413,14 @@ class AdamW(Optimizer):
         # pylint: disable=W0622
         @_no_grad()
         def _pre_forward_cell_hook(cell, input):
-            for cell_param in cell.get_parameters():
-                ag_param = comm_func.all_gather_into_tensor(cell_param, group=self.dp_cp_group)[0]
-                cell_param.assign_value(ag_param)
+            self._all_gather_params(self.z3_cell_params[id(cell)])
             return input
 
         # pylint: disable=W0622, W0613
         @_no_grad()
         def _post_forward_cell_hook(cell, input, output):
-            for cell_param in cell.get_parameters():
-                if cell_param.name in self.skip_bias_add_list:
-                    continue
-                split_param = self.split(cell_param)[self.shard_id].contiguous()
-                cell_param.assign_value(split_param)
+            for cell_param in self.z3_cell_split_params[id(cell)]:
+                self._split_param(cell_param)
             return output
 
         # pylint: disable=W0622, W0613
@@ -341,11 +428,7 @@ class AdamW(Optimizer):
             if not hasattr(cell, "pre_back_cell"):
                 @_no_grad()
                 def _run_before_backward_function(sub_cell):
-                    for cell_param in sub_cell.get_parameters():
-                        if cell_param.name in self.skip_bias_add_list:
-                            continue
-                        ag_param = comm_func.all_gather_into_tensor(cell_param, group=self.dp_cp_group)[0]
-                        cell_param.assign_value(ag_param)
+                    self._all_gather_params(self.z3_cell_split_params[id(sub_cell)])
 
                 class PreBackwardCell(nn.Cell):
                     "Insert a cell before backward propagation"
@@ -372,9 +455,8 @@ class AdamW(Optimizer):
             if not hasattr(cell, "post_back_cell"):
                 @_no_grad()
                 def _run_after_backward_function(sub_cell):
-                    for cell_param in sub_cell.get_parameters():
-                        split_param = self.split(cell_param)[self.shard_id].contiguous()
-                        cell_param.assign_value(split_param)
+                    for cell_param in self.z3_cell_params[id(sub_cell)]:
+                        self._split_param(cell_param)
 
                 class PostBackwardCell(nn.Cell):
                     "Insert a cell after backward propagation"
@@ -396,26 +478,30 @@ class AdamW(Optimizer):
             return cell.post_back_cell(input)
 
         self.z3_optim_cells = []
-        self.skip_bias_add_list = []
-
-        def recursion_cells(cell):
-            sub_cells_list = cell.cells()
-            for sub_cell in sub_cells_list:
-                if sub_cell.__class__.__name__ in ["ColumnParallelLinear", "RowParallelLinear"] and sub_cell.use_zero3:
-                    if sub_cell.has_bias and sub_cell.skip_bias_add:
-                        self.skip_bias_add_list.append(sub_cell.bias.name)
-                    self.z3_optim_cells.append(sub_cell)
-                else:
-                    recursion_cells(sub_cell)
-        recursion_cells(self.network)
-
-        if self.param_resident and self.param_resident_rate < 1:
-            zero3_param_numel = {}
-            for i, sub_cell in enumerate(self.z3_optim_cells):
-                sub_cell_param_numel = 0
-                for sub_cell_param in sub_cell.get_parameters():
-                    sub_cell_param_numel += sub_cell_param.numel()
-                zero3_param_numel[i] = sub_cell_param_numel
+        self.skip_bias_add_set = set()
+        # parameters of each zero3 cell, collected once instead of walking the cell in every hook
+        self.z3_cell_params = {}
+        # parameters split after forward, i.e. without the bias kept for skip_bias_add
+        self.z3_cell_split_params = {}
+        # preallocated local shard of each zero3 parameter
+        self.z3_shard_buffers = {}
+
+        # depth-first search in the same order as the cells are defined
+        cells_stack = list(self.network.cells())[::-1]
+        while cells_stack:
+            sub_cell = cells_stack.pop()
+            if sub_cell.__class__.__name__ in ["ColumnParallelLinear", "RowParallelLinear"] and sub_cell.use_zero3:
+                if sub_cell.has_bias and sub_cell.skip_bias_add:
+                    self.skip_bias_add_set.add(sub_cell.bias.name)
+                self.z3_optim_cells.append(sub_cell)
+                self.z3_cell_params[id(sub_cell)] = list(sub_cell.get_parameters())
+            else:
+                cells_stack.extend(list(sub_cell.cells())[::-1])
+
+        if self.param_resident and self.param_resident_rate < 1 and self.z3_optim_cells:
+            zero3_param_numel = np.array([sum(int(np.prod(sub_cell_param.shape))
+                                              for sub_cell_param in self.z3_cell_params[id(sub_cell)])
+                                          for sub_cell in self.z3_optim_cells], dtype=np.int64)
             resident_cell_id = self._param_resident_flag(zero3_param_numel, self.param_resident_rate)
 
         self.zero3_parameters = []
@@ -426,65 +512,144 @@ class AdamW(Optimizer):
                 sub_cell.register_forward_hook(_post_forward_cell_hook)
                 sub_cell.register_forward_hook(_pre_backward_cell_hook)
             elif sub_cell.has_bias and sub_cell.skip_bias_add:
-                self.skip_bias_add_list.remove(sub_cell.bias.name)
+                self.skip_bias_add_set.discard(sub_cell.bias.name)
             sub_cell.register_forward_pre_hook(_post_backward_cell_hook)
-            for sub_cell_param in sub_cell.get_parameters():
+            for sub_cell_param in self.z3_cell_params[id(sub_cell)]:
                 self.zero3_parameters.append(sub_cell_param.name)
 
+        for sub_cell in self.z3_optim_cells:
+            self.z3_cell_split_params[id(sub_cell)] = [cell_param for cell_param in self.z3_cell_params[id(sub_cell)]
+                                                       if cell_param.name not in self.skip_bias_add_set]
+
+    def _split_param(self, param):
+        """Keep the local shard of a gathered parameter, copied into its preallocated shard buffer."""
+        shard_dim = param.shape[0] // self.shard_size
+        shard_buffer = self.z3_shard_buffers.get(id(param))
+        if shard_buffer is None:
+            shard_buffer = mint.zeros((shard_dim,) + tuple(param.shape[1:]), dtype=param.dtype)
+            self.z3_shard_buffers[id(param)] = shard_buffer
+        shard_buffer.copy_(mint.narrow(param, 0, self.shard_id * shard_dim, shard_dim))
+        param.assign_value(shard_buffer)
+
+    def _all_gather_params(self, params, shards=None):
+        """
+        All-gather sharded parameters and load them. `shards` are the local shards to be gathered, the
+        parameters themselves are used if not given. Shards with the same dtype are flattened into buckets,
+        so that a single collective is launched per bucket instead of one per parameter.
+        """
+        if shards is None:
+            shards = params
+        buckets = []
+        dtype_to_bucket = {}
+        for param, shard in zip(params, shards):
+            numel = int(np.prod(shard.shape))
+            bucket = dtype_to_bucket.get(shard.dtype)
+            if bucket is None or (bucket[0] + numel) * self.shard_size > ALL_GATHER_BUCKET_SIZE:
+                bucket = [0, []]
+                dtype_to_bucket[shard.dtype] = bucket
+                buckets.append(bucket)
+            bucket[0] += numel
+            bucket[1].append((param, shard))
+        for _, bucket in buckets:
+            if len(bucket) == 1:
+                param, shard = bucket[0]
+                param.assign_value(comm_func.all_gather_into_tensor(shard, group=self.dp_cp_group)[0])
+                continue
+            flat_shards = mint.cat([shard.reshape(-1) for _, shard in bucket])
+            gathered = comm_func.all_gather_into_tensor(flat_shards, group=self.dp_cp_group)[0]
+            # each rank contributes its shards in the same order, and parameters are sharded on dim 0,
+            # so column slices of [shard_size, bucket_numel] are exactly the full parameters.
+            gathered = gathered.reshape(self.shard_size, -1)
+            offset = 0
+            for param, shard in bucket:
+                numel = int(np.prod(shard.shape))
+                full_param = gathered[:, offset:offset + numel].contiguous()
+                param.assign_value(full_param.reshape((-1,) + tuple(shard.shape[1:])))
+                offset += numel
+
+    def _update_params(self, updates):
+        """Load updated parameters, the sharded ones are cast to parameter dtype before being all-gathered."""
+        gather_params = []
+        gather_shards = []
+        for param, update, all_gather in zip(self._parameters, updates, self.all_gather_ops):
+            if update.dtype != param.dtype:
+                update = ops.cast(update, param.dtype)
+            if all_gather:
+                gather_params.append(param)
+                gather_shards.append(update)
+            else:
+                param.assign_value(update)
+        if gather_params:
+            self._all_gather_params(gather_params, gather_shards)
+
     def _parameter_status_split(self):
         """split parameters and status"""
-        for i, param in enumerate(self._parameters):
-            if self.zero_level == 'z3':
-                if param.name in self.zero3_parameters:
-                    self._parameter_splited[i] = True
-                else:
-                    if param.shape[0] % self.shard_size == 0:
-                        self._status_splited[i] = True
-            else:
-                if param.shape[0] % self.shard_size == 0:
-                    self._status_splited[i] = True
+        param_num = len(self._parameters)
+        divisible = np.fromiter((param.shape[0] for param in self._parameters), dtype=np.int64,
+                                count=param_num) % self.shard_size == 0
+        if self.zero_level == 'z3':
+            zero3_parameters = set(self.zero3_parameters)
+            parameter_splited = np.fromiter((param.name in zero3_parameters for param in self._parameters),
+                                            dtype=np.bool_, count=param_num)
+            self._parameter_splited = parameter_splited.tolist()
+            divisible &= ~parameter_splited
+        self._status_splited = divisible.tolist()
 
     def _regist_hook_for_params(self):
         """Register hook for model parameters for optimizer parallel."""
 
         def reduce_scatter_hook(grad):
-            res = comm_func.reduce_scatter_tensor(grad, group=self.dp_cp_group)[0]
-            if not self.grad_allreduce_sum:
-                res = mint.div(res, self.shard_size)
-            return res
+            return self._reduce_grad(comm_func.reduce_scatter_tensor, grad)
 
         def reduce_hook(grad):
-            res = comm_func.all_reduce(grad, group=self.dp_cp_group)[0]
-            if not self.grad_allreduce_sum:
-                res = mint.div(res, self.shard_size)
-            return res
+            return self._reduce_grad(comm_func.all_reduce, grad)
 
+        # only the shard of status is updated by each rank, so z1 also reduce-scatters the gradients
         for i, param in enumerate(self._parameters):
-            if (self._parameter_splited[i] or self._status_splited[i]) and self.zero_level in ["z2", "z3"]:
+            if self._grad_reduce_scatter[i]:
                 param.register_hook(reduce_scatter_hook)
             else:
                 param.register_hook(reduce_hook)
 
+    def _reduce_grad(self, reducer, grad):
+        """Reduce gradient among data parallel group, asynchronously if overlap_grad_reduce is enabled."""
+        if self.overlap_grad_reduce:
+            res, handle = reducer(grad, group=self.dp_cp_group, async_op=True)
+            self._grad_reduce_handles.append((res, handle))
+            return res
+        res = reducer(grad, group=self.dp_cp_group)[0]
+        if not self.grad_allreduce_sum:
+            res = mint.mul(res, self.grad_mean_scale)
+        return res
+
+    def wait_grad_reduce(self):
+        """Wait for the gradient reduce issued asynchronously during backward propagation."""
+        for res, handle in self._grad_reduce_handles:
+            handle.wait()
+            if not self.grad_allreduce_sum:
+                res.copy_(mint.mul(res, self.grad_mean_scale))
+        self._grad_reduce_handles = []
+
     def _init_momentum(self, params, prefix, init="zeros"):
         """Init momentum or variance for adamw optimizer."""
-        moments_list = []
-        for i, param in enumerate(params):
-            param_shape = param.shape
-            if self._status_splited[i]:
-                param_shape = list(param_shape)
-                param_shape[0] = param_shape[0] // self.shard_size
-                moment = ms.Parameter(initializer(init, shape=tuple(param_shape), dtype=mstype.float32),
-                                      name=prefix + "." + param.name)
-                moments_list.append(moment)
-            else:
-                moment = ms.Parameter(initializer(init, shape=param_shape, dtype=mstype.float32),
-                                      name=prefix + "." + param.name)
-                moments_list.append(moment)
-
+        if self._status_shapes is None:
+            self._status_shapes = [
+                (param.shape[0] // self.shard_size,) + tuple(param.shape[1:]) if status_splited else tuple(param.shape)
+                for param, status_splited in zip(params, self._status_splited)
+            ]
+        moments_list = [ms.Parameter(initializer(init, shape=status_shape, dtype=self.moments_dtype),
+                                     name=prefix + "." + param.name)
+                        for param, status_shape in zip(params, self._status_shapes)]
         return ParameterTuple(moments_list)
 
     def _offload_optimizer_params(self):
-        """Offload optimizer parameters to host."""
+        """
+        Offload optimizer parameters to host. They are only updated by host operators afterwards,
+        so this is done once instead of every step.
+        """
+        if self._opt_params_offloaded:
+            return
+        self._opt_params_offloaded = True
         for _, value in self._opt_params_need_offload.items():
             # pylint: disable=W0212
             if isinstance(value, ParameterTuple):
@@ -495,13 +660,15 @@ class AdamW(Optimizer):
 
     def construct(self, grads):
         """construct method"""
-        if self.zero_level == "z1":
+        self.wait_grad_reduce()
+        if self.zero_level == "z1" and self.allreduce_after_grad_accumulation:
+            # otherwise grads of splited status are already reduce-scattered by the param hooks
             grads = self.hyper_map(F.partial(_split_params, self.shard_id, self.split),
                                    grads, self._status_splited)
         if self.allreduce_after_grad_accumulation and self.zero_level in ["z2", "z3"]:
             grads = self.hyper_map(F.partial(_inner_grad_reduce_scatter, self.dp_cp_group,
-                                             self.grad_allreduce_sum, self.shard_size),
-                                   grads, self._status_splited, self._parameter_splited)
+                                             self.grad_allreduce_sum, self.grad_mean_scale),
+                                   grads, self._grad_reduce_scatter)
         params = self.hyper_map(F.partial(_split_params, self.shard_id, self.split),
                                 self._parameters, self._status_splited)
         grads = self.flatten_gradients(grads)
@@ -511,47 +678,71 @@ class AdamW(Optimizer):
         # pylint: disable=W0212
         if self.cpu_offload:
             self._offload_optimizer_params()
-            for grad in grads:
+            for grad, param in zip(grads, params):
                 grad._offload()
-            for param in params:
                 param._offload()
 
         self.assignadd(self.global_step, self.global_step_increase_tensor)
 
+        # global_step stays on device for checkpoint, the bias corrections are computed from its host copy,
+        # which is read again after `reset_host_step`
+        if self._host_step is None:
+            self._host_step = int(self.global_step.asnumpy()[0])
+        else:
+            self._host_step += 1
+        bias_correction1 = 1.0 - math.pow(self._betas[0], self._host_step)
+        bias_correction2 = 1.0 - math.pow(self._betas[1], self._host_step)
+        if self.use_fused_kernel:
+            sqrt_bias_correction2 = math.sqrt(bias_correction2)
+            lr_scale = sqrt_bias_correction2 / bias_correction1
+            group_scalars = self._get_group_scalars(
+                lambda group_lr, group_wd: (group_lr * lr_scale, group_wd / lr_scale), lr, weight_decay)
+            opt = F.partial(_fused_adamw_opt, self.fused_opt, self.op_cast, self.beta1, self.beta2,
+                            Tensor(np.array([self._eps * sqrt_bias_correction2]).astype(np.float32)))
+        elif self.jit_update:
+            group_scalars = self._get_group_scalars(
+                lambda group_lr, group_wd: (1 - group_lr * group_wd, group_lr / bias_correction1), lr, weight_decay)
+            opt = F.partial(_jit_adamw_opt, self.beta2, self.one_minus_beta1, self.one_minus_beta2, self.eps,
+                            Tensor(np.array([bias_correction2]).astype(np.float32)))
+        else:
+            group_scalars = self._get_group_scalars(
+                lambda group_lr, group_wd: (1 - group_lr * group_wd, group_lr / bias_correction1), lr, weight_decay)
+            opt = F.partial(_adamw_opt, self.op_mul, self.op_sqrt, self.addcmul, self.op_lerp, self.op_cast,
+                            self.beta2, self.one_minus_beta1, self.one_minus_beta2, self.eps,
+                            Tensor(np.array([bias_correction2]).astype(np.float32)))
+
         if self.is_group:
-            if self.is_group_lr:
-                optim_result = self.hyper_map(
-                    F.partial(_adamw_opt, self.op_mul, self.op_pow, self.op_sqrt,
-                              self.addcmul, self.op_cast, self.beta1, self.beta2, self.eps, self.global_step),
-                    lr,
-                    weight_decay,
-                    params,
-                    grads,
-                    self.moments1,
-                    self.moments2,
-                )
-            else:
-                optim_result = self.hyper_map(
-                    F.partial(_adamw_opt, self.op_mul, self.op_pow, self.op_sqrt,
-                              self.addcmul, self.op_cast, self.beta1, self.beta2, self.eps, self.global_step, lr),
-                    weight_decay,
-                    params,
-                    grads,
-                    self.moments1,
-                    self.moments2
-                )
+            lr_scalars, wd_scalars = zip(*group_scalars)
+            optim_result = self.hyper_map(opt, lr_scalars, wd_scalars, params, grads, self.moments1, self.moments2)
         else:
-            optim_result = self.hyper_map(
-                F.partial(_adamw_opt, self.op_mul, self.op_pow, self.op_sqrt,
-                          self.addcmul, self.op_cast, self.beta1, self.beta2, self.eps, self.global_step, lr,
-                          weight_decay),
-                params,
-                grads,
-                self.moments1,
-                self.moments2
-            )
-
-        self.hyper_map(F.partial(_update_params, self.dp_cp_group), self._parameters, optim_result, self.all_gather_ops)
+            optim_result = self.hyper_map(F.partial(opt, *group_scalars), params, grads, self.moments1,
+                                          self.moments2)
+
+        self._update_params(optim_result)
+
+    def reset_host_step(self):
+        """
+        Drop the host copy of the step, so that it is read from `global_step` again on the next update.
+        Must be called whenever `global_step` is changed outside the optimizer, e.g. by loading a checkpoint.
+        """
+        self._host_step = None
+
+    def _get_group_scalars(self, func, lr, weight_decay):
+        """
+        Compute the per-step scalars of the update from learning rate and weight decay. For grouped
+        parameters, `func` is evaluated once per distinct (lr, weight_decay) pair instead of once per parameter.
+        """
+        if not self.is_group:
+            return func(lr, weight_decay)
+        group_lr = lr if self.is_group_lr else (lr,) * len(weight_decay)
+        cached_scalars = {}
+        group_scalars = []
+        for param_lr, param_wd in zip(group_lr, weight_decay):
+            key = (id(param_lr), id(param_wd))
+            if key not in cached_scalars:
+                cached_scalars[key] = func(param_lr, param_wd)
+            group_scalars.append(cached_scalars[key])
+        return tuple(group_scalars)
 
     def sharded_state_dict(self, model_sharded_state_dict):
         """provide optim's sharded state dict based on the model's sharding info"""
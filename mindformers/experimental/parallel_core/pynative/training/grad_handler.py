@@ -26,6 +26,7 @@ from mindspore.ops import composite as C
 from mindspore.communication import get_group_size, GlobalComm
 
 from mindformers.experimental.parallel_core.pynative.parallel_state import (
+    get_data_parallel_rank,
     get_model_parallel_group,
     get_tensor_model_parallel_rank,
     is_pipeline_last_stage
@@ -129,7 +130,7 @@ class ClipGlobalNorm(nn.Cell):
     """
 
     def __init__(self, params, reduce_comm_group, clip_value=1.0, norm_type="l2",
-                 share_embeddings_and_output_weights=True):
+                 share_embeddings_and_output_weights=True, zero_grads_sharded=False):
         super(ClipGlobalNorm, self).__init__()
         self.params = params
         self.clip_value = clip_value
@@ -137,6 +138,9 @@ class ClipGlobalNorm(nn.Cell):
         self.norm_type = norm_type
         self.reduce_comm_group = reduce_comm_group
         self.share_embeddings_and_output_weights = share_embeddings_and_output_weights
+        # with ZeRO, grads are reduce-scattered among data parallel ranks, except those of full shape
+        # which are all-reduced and duplicated on every data parallel rank
+        self.zero_grads_sharded = zero_grads_sharded
         self.clip_func = inplace_apply_to_tensor_list(self.grad_scale_func)
 
     def grad_scale_func(self, grad, scale):
@@ -148,8 +152,11 @@ class ClipGlobalNorm(nn.Cell):
         get grads to norm, include weight/bias(not duplicate) and layernorm(duplicate, only pick grad on rank0)
         """
         rank_id = get_tensor_model_parallel_rank()
+        dp_rank_id = get_data_parallel_rank() if self.zero_grads_sharded else 0
         norm_grads = ()
         for i, param in enumerate(self.params):
+            if dp_rank_id != 0 and grads[i].shape == param.shape:
+                continue
             tp_duplicate_params = (
                 ("norm" in param.name)
                 or ("mlp.projection.bias" in param.name)
@@ -208,12 +215,16 @@ def get_grad_process_func(training_config, share_embeddings_and_output_weights=T
                 raise ValueError("params is required for ClipGlobalNorm")
             grad_process_func_kwargs["params"] = kwargs["params"]
             if training_config.use_distributed_optimizer or \
-                    training_config.parallel_config.zero_level in ["z2", "z3"]:
+                    training_config.parallel_config.zero_level in ["z1", "z2", "z3"]:
                 reduce_comm_group = GlobalComm.WORLD_COMM_GROUP
             else:
                 reduce_comm_group = get_model_parallel_group()
             grad_process_func_kwargs["reduce_comm_group"] = reduce_comm_group
             grad_process_func_kwargs["share_embeddings_and_output_weights"] = share_embeddings_and_output_weights
+            # z3 parameters are sharded themselves, so grads of full shape can not be told apart there
+            if not training_config.use_distributed_optimizer and \
+                    training_config.parallel_config.zero_level in ["z1", "z2"]:
+                grad_process_func_kwargs["zero_grads_sharded"] = True
         return grad_clip_cls(**grad_process_func_kwargs)
     return grad_clip_cls
 
@@ -15,7 +15,7 @@
 """Learning rate decay and weight decay incr functions."""
 
 import math
-import mindspore as ms
+from mindspore import Tensor, Parameter
 import mindspore.common.dtype as mstype
 
 from mindformers.tools import logger
@@ -24,9 +24,50 @@ lr_decay_style_list = ["constant", "WSD", "linear", "cosine", "inverse-square-ro
 wd_incr_style_list = ["constant", "linear", "cosine"]
 
 
+def _linear_decay_coeff(decay_ratio):
+    """Linear decay coefficient, from 1.0 to 0.0 as decay_ratio goes from 0.0 to 1.0."""
+    return 1.0 - decay_ratio
+
+
+def _cosine_decay_coeff(decay_ratio):
+    """Half cosine decay coefficient, from 1.0 to 0.0 as decay_ratio goes from 0.0 to 1.0."""
+    return 0.5 * (math.cos(math.pi * decay_ratio) + 1.0)
+
+
+def _exponential_decay_coeff(decay_ratio):
+    """Exponential decay coefficient, from 1.0 to 0.0 as decay_ratio goes from 0.0 to 1.0."""
+    return 2.0 * 0.5 ** decay_ratio - 1.0
+
+
+# ids of lr decay styles and wd incr styles, the index in `lr_decay_style_list` and `wd_incr_style_list`
+_LR_CONSTANT, _LR_WSD, _LR_LINEAR, _LR_COSINE, _LR_INVERSE_SQUARE_ROOT = range(len(lr_decay_style_list))
+_WD_CONSTANT, _WD_LINEAR, _WD_COSINE = range(len(wd_incr_style_list))
+_LR_DECAY_STYLE_ID = {style: style_id for style_id, style in enumerate(lr_decay_style_list)}
+_WD_INCR_STYLE_ID = {style: style_id for style_id, style in enumerate(wd_incr_style_list)}
+
+# keys of the scheduler in a checkpoint, and the ones of them stored as integers
+_STATE_DICT_KEYS = frozenset(['max_lr', 'lr_warmup_steps', 'num_steps', 'lr_decay_style', 'lr_decay_steps',
+                              'min_lr', 'start_wd', 'end_wd', 'wd_incr_style', 'wd_incr_steps'])
+_INT_STATE_DICT_KEYS = frozenset(['lr_warmup_steps', 'num_steps', 'lr_decay_style', 'lr_decay_steps',
+                                  'wd_incr_style', 'wd_incr_steps'])
+
+_WSD_DECAY_COEFF_FNS = {
+    "linear": _linear_decay_coeff,
+    "cosine": _cosine_decay_coeff,
+    "exponential": _exponential_decay_coeff,
+}
+
+
 class OptimizerParamScheduler():
     """Anneals learning rate and weight decay"""
 
+    # the scheduler is touched every step, slots make its attribute access cheaper
+    __slots__ = ('optimizer', 'init_lr', 'max_lr', 'min_lr', 'lr_warmup_steps', 'num_steps', 'lr_decay_steps',
+                 'wsd_decay_steps', 'lr_wsd_decay_style', 'lr_decay_style', 'start_wd', 'end_wd', 'wd_incr_steps',
+                 'wd_incr_style', 'override_opt_param_scheduler', 'use_checkpoint_opt_param_scheduler',
+                 '_lr_decay_id', '_lr_decay_coeff_fn', '_wsd_decay_coeff_fn', '_wd_incr_id', '_delta_wd',
+                 '_assigned_lrs', '_lr_mults', '_wd_mults', '_group_lr_bounds', '_schedule_settled')
+
     def __init__(self, optimizer, init_lr, max_lr, min_lr,
                  lr_warmup_steps, lr_decay_steps, lr_decay_style,
                  start_wd, end_wd, wd_incr_steps, wd_incr_style,
@@ -68,6 +109,7 @@ class OptimizerParamScheduler():
         if self.lr_decay_style == "WSD":
             if self.wsd_decay_steps is None:
                 raise Exception("wsd_decay_steps is None")
+        self._resolve_lr_decay_style()
 
         self.start_wd = start_wd
         self.end_wd = end_wd
@@ -79,6 +121,7 @@ class OptimizerParamScheduler():
                              f'but got end_wd {self.end_wd} and start_wd {self.start_wd}')
         self.wd_incr_steps = wd_incr_steps
         self.wd_incr_style = wd_incr_style
+        self._check_wd_incr_style()
 
         self.override_opt_param_scheduler = override_opt_param_scheduler
         self.use_checkpoint_opt_param_scheduler = use_checkpoint_opt_param_scheduler
@@ -98,43 +141,122 @@ class OptimizerParamScheduler():
                 "can not be True at the same time."
                 )
 
+        self.refresh_group_cache()
+
         # Set the learning rate
         self.step(0)
 
+    def _check_wd_incr_style(self):
+        """Check weight decay incr style and resolve its id and wd range once, instead of in every `get_wd`."""
+        if self.wd_incr_style not in _WD_INCR_STYLE_ID:
+            raise Exception('{} weight decay increment style is not supported.'.format(
+                self.wd_incr_style))
+        if self.wd_incr_style == 'constant' and self.start_wd != self.end_wd:
+            raise ValueError("when wd_incr_style is constant, start_wd need to be equal to end_wd.")
+        self._wd_incr_id = _WD_INCR_STYLE_ID[self.wd_incr_style]
+        self._delta_wd = self.end_wd - self.start_wd
+
     def get_wd(self):
         """ Weight decay incr functions"""
-        if self.num_steps > self.wd_incr_steps:
-            return self.end_wd
-
-        if self.wd_incr_style == 'constant':
-            if self.start_wd != self.end_wd:
-                raise ValueError("when wd_incr_style is constant, start_wd need to be equal to end_wd.")
+        if self.num_steps > self.wd_incr_steps or self._wd_incr_id == _WD_CONSTANT:
             return self.end_wd
 
+        # num_steps is in [0, wd_incr_steps] here, so is the ratio in [0.0, 1.0]
         incr_ratio = float(self.num_steps) / float(self.wd_incr_steps)
-        if incr_ratio < 0.0 or incr_ratio > 1.0:
-            raise ValueError(f"incr_ratio should be in range [0.0, 1.0], but got {incr_ratio}")
-        delta_wd = self.end_wd - self.start_wd
 
-        if self.wd_incr_style == 'linear':
+        if self._wd_incr_id == _WD_LINEAR:
             coeff = incr_ratio
-        elif self.wd_incr_style == 'cosine':
-            coeff = 0.5 * (math.cos(math.pi * (1 - incr_ratio)) + 1.0)
         else:
-            raise Exception('{} weight decay increment style is not supported.'.format(
-                self.wd_incr_style))
+            coeff = _cosine_decay_coeff(1 - incr_ratio)
+
+        return self.start_wd + coeff * self._delta_wd
+
+
+    def _resolve_lr_decay_style(self):
+        """Resolve the lr decay styles to an id and coefficient functions once, `step` dispatches on them."""
+        if self.lr_decay_style not in _LR_DECAY_STYLE_ID:
+            raise Exception('{} decay style is not supported.'.format(
+                self.lr_decay_style))
+        self._lr_decay_id = _LR_DECAY_STYLE_ID[self.lr_decay_style]
+        self._lr_decay_coeff_fn = {
+            _LR_WSD: self._wsd_decay_coeff,
+            _LR_LINEAR: _linear_decay_coeff,
+            _LR_COSINE: _cosine_decay_coeff,
+        }.get(self._lr_decay_id)
+        self._wsd_decay_coeff_fn = _WSD_DECAY_COEFF_FNS.get(self.lr_wsd_decay_style)
+
+    def refresh_group_cache(self):
+        """
+        Snapshot the per param group settings used by `step`: lr_mult, wd_mult, max_lr and min_lr.
+        They are fixed during training, call this after changing them in `optimizer.param_groups`
+        so that the next step applies them.
+        """
+        param_groups = self.optimizer.param_groups
+        self._lr_mults = tuple(param_group.get('lr_mult', 1.0) for param_group in param_groups)
+        self._wd_mults = tuple(param_group.get('wd_mult', 1.0) for param_group in param_groups)
+        self._group_lr_bounds = {}
+        for param_group in param_groups:
+            max_lr = param_group.get('max_lr', self.max_lr)
+            min_lr = param_group.get('min_lr', self.min_lr)
+            self._group_lr_bounds[id(param_group)] = (max_lr, min_lr, max_lr - min_lr)
+        # lr last assigned to each `optimizer.lrs` tensor, a new tensor is only built when it changes
+        self._assigned_lrs = [None] * len(param_groups)
+        # whether lr and wd were already set to their final values by a previous step
+        self._schedule_settled = False
+
+    def _in_lr_decay(self):
+        """Whether the current step is in the decay phase, where the lr depends on the decay style."""
+        if self.lr_warmup_steps > 0 and self.num_steps <= self.lr_warmup_steps:
+            return False
+        return self._lr_decay_id != _LR_CONSTANT and self.num_steps <= self.lr_decay_steps
 
-        return self.start_wd + coeff * delta_wd
+    def _wsd_decay_coeff(self, decay_ratio):
+        """
+        WSD decay coefficient, stable until the last `wsd_decay_steps` steps which are annealed.
+        The decay ratio of the whole decay phase is not used, the anneal has its own ratio.
+        """
+        del decay_ratio
+        wsd_anneal_start_ = self.lr_decay_steps - self.wsd_decay_steps
+        if self.num_steps <= wsd_anneal_start_:
+            return 1.0
+        wsd_steps = self.num_steps - wsd_anneal_start_
+        wsd_decay_ratio = float(wsd_steps) / float(self.wsd_decay_steps)
+        if self._wsd_decay_coeff_fn is None:
+            raise Exception('{} wsd decay style is not supported.'.format(
+                self.lr_wsd_decay_style))
+        return self._wsd_decay_coeff_fn(wsd_decay_ratio)
+
+    def _get_lr_coeff(self):
+        """
+        Decay coefficient of the current step. It does not depend on the param group, so `step`
+        computes it once for all groups. Returns None outside the decay phase and for inverse-square-root,
+        whose lr is computed directly from max_lr.
+        """
+        if not self._in_lr_decay() or self._lr_decay_id == _LR_INVERSE_SQUARE_ROOT:
+            return None
+
+        # num_steps is in [lr_warmup_steps, lr_decay_steps] in the decay phase, so is the ratio in [0.0, 1.0]
+        num_steps_ = self.num_steps - self.lr_warmup_steps
+        decay_steps_ = self.lr_decay_steps - self.lr_warmup_steps
+        decay_ratio = float(num_steps_) / float(decay_steps_)
 
+        return self._lr_decay_coeff_fn(decay_ratio)
 
-    def get_lr(self, param_group):
+    def get_lr(self, param_group, coeff=None):
         """
         Learning rate decay functions from:
         https://openreview.net/pdf?id=BJYwwY9ll pg. 4
+
+        `coeff` is the decay coefficient of the current step from `_get_lr_coeff`, it is computed
+        here if not given.
         """
 
-        max_lr = param_group.get('max_lr', self.max_lr)
-        min_lr = param_group.get('min_lr', self.min_lr)
+        lr_bounds = self._group_lr_bounds.get(id(param_group))
+        if lr_bounds is None:
+            max_lr = param_group.get('max_lr', self.max_lr)
+            min_lr = param_group.get('min_lr', self.min_lr)
+            lr_bounds = (max_lr, min_lr, max_lr - min_lr)
+        max_lr, min_lr, delta_lr = lr_bounds
 
         # Use linear warmup for the initial part.
         if self.lr_warmup_steps > 0 and self.num_steps <= self.lr_warmup_steps:
@@ -148,7 +270,7 @@ class OptimizerParamScheduler():
             )
 
         # If the learning rate is constant, just return the initial value.
-        if self.lr_decay_style == 'constant':
+        if self._lr_decay_id == _LR_CONSTANT:
             return max_lr
 
         # For any steps larger than `self.lr_decay_steps`, use `min_lr`.
@@ -156,65 +278,54 @@ class OptimizerParamScheduler():
             return min_lr
 
         # If we are done with the warmup period, use the decay style.
-        if self.lr_decay_style == 'inverse-square-root':
+        if self._lr_decay_id == _LR_INVERSE_SQUARE_ROOT:
             warmup_steps = max(self.lr_warmup_steps, 1)
             num_steps = max(self.num_steps, 1)
             lr = max_lr * warmup_steps ** 0.5 / (num_steps ** 0.5)
             return max(min_lr, lr)
 
-        num_steps_ = self.num_steps - self.lr_warmup_steps
-        decay_steps_ = self.lr_decay_steps - self.lr_warmup_steps
-        decay_ratio = float(num_steps_) / float(decay_steps_)
-        if decay_ratio < 0.0 or decay_ratio > 1.0:
-            raise ValueError(f"decay_ratio should be in range [0.0, 1.0], but got {decay_ratio}")
-        delta_lr = max_lr - min_lr
-
-        if self.lr_decay_style == 'linear':
-            coeff = (1.0 - decay_ratio)
-        elif self.lr_decay_style == 'cosine':
-            coeff = 0.5 * (math.cos(math.pi * decay_ratio) + 1.0)
-        elif self.lr_decay_style == 'WSD':
-            wsd_anneal_start_ = self.lr_decay_steps - self.wsd_decay_steps
-            if self.num_steps <= wsd_anneal_start_:
-                coeff = 1.0
-            else:
-                wsd_steps = self.num_steps - wsd_anneal_start_
-                wsd_decay_ratio = float(wsd_steps) / float(self.wsd_decay_steps)
-                if self.lr_wsd_decay_style == "linear":
-                    coeff = (1.0 - wsd_decay_ratio)
-                elif self.lr_wsd_decay_style == "cosine":
-                    coeff = 0.5 * (math.cos(math.pi * wsd_decay_ratio) + 1.0)
-                elif self.lr_wsd_decay_style == "exponential":
-                    coeff = ((2.0 * math.pow(0.5, wsd_decay_ratio)) - 1.0)
-        else:
-            raise Exception('{} decay style is not supported.'.format(
-                self.lr_decay_style))
-
+        if coeff is None:
+            coeff = self._get_lr_coeff()
         return min_lr + coeff * delta_lr
 
 
+    def _is_schedule_settled(self):
+        """Whether lr and wd stay unchanged for all the following steps."""
+        lr_final_step = self.lr_warmup_steps if self._lr_decay_id == _LR_CONSTANT else self.lr_decay_steps
+        if self.num_steps <= lr_final_step:
+            return False
+        return self._wd_incr_id == _WD_CONSTANT or self.num_steps > self.wd_incr_steps
+
     def step(self, increment):
         """Set lr for all parameters groups."""
         self.num_steps += increment
+        # param groups already hold the final lr and wd
+        if self._schedule_settled and increment >= 0:
+            return
         new_wd = self.get_wd()
-        for group_idx, param_group in enumerate(self.optimizer.param_groups):
-            new_lr = self.get_lr(param_group)
-            param_group['lr'] = new_lr * param_group.get('lr_mult', 1.0)
-            self.optimizer.lrs[group_idx].assign_value(ms.Tensor(param_group['lr'], dtype=mstype.float64))
-            param_group['weight_decay'] = new_wd * param_group.get('wd_mult', 1.0)
+        lr_coeff = self._get_lr_coeff()
+        for group_idx, (param_group, lr_mult, wd_mult) in enumerate(
+                zip(self.optimizer.param_groups, self._lr_mults, self._wd_mults)):
+            new_lr = self.get_lr(param_group, lr_coeff) * lr_mult
+            param_group['lr'] = new_lr
+            if new_lr != self._assigned_lrs[group_idx]:
+                self.optimizer.lrs[group_idx].assign_value(Tensor(new_lr, dtype=mstype.float64))
+                self._assigned_lrs[group_idx] = new_lr
+            param_group['weight_decay'] = new_wd * wd_mult
+        self._schedule_settled = self._is_schedule_settled()
 
     def state_dict(self):
         """dict of lr param"""
         state_dict = {
-            'max_lr': ms.Parameter(ms.Tensor(self.max_lr, dtype=ms.float64)),
+            'max_lr': Parameter(Tensor(self.max_lr, dtype=mstype.float64)),
             'lr_warmup_steps': self.lr_warmup_steps,
             'num_steps': self.num_steps,
-            'lr_decay_style': lr_decay_style_list.index(self.lr_decay_style),
+            'lr_decay_style': self._lr_decay_id,
             'lr_decay_steps': self.lr_decay_steps,
-            'min_lr': ms.Parameter(ms.Tensor(self.min_lr, dtype=ms.float64)),
-            'start_wd': ms.Parameter(ms.Tensor(self.start_wd, dtype=ms.float64)),
-            'end_wd': ms.Parameter(ms.Tensor(self.end_wd, dtype=ms.float64)),
-            'wd_incr_style': wd_incr_style_list.index(self.wd_incr_style),
+            'min_lr': Parameter(Tensor(self.min_lr, dtype=mstype.float64)),
+            'start_wd': Parameter(Tensor(self.start_wd, dtype=mstype.float64)),
+            'end_wd': Parameter(Tensor(self.end_wd, dtype=mstype.float64)),
+            'wd_incr_style': self._wd_incr_id,
             'wd_incr_steps': self.wd_incr_steps
         }
         return state_dict
@@ -234,16 +345,11 @@ class OptimizerParamScheduler():
 
     def load_state_dict(self, sd):
         """load param of lr"""
+        # only visit the scheduler keys, `sd` is the whole checkpoint
         new_sd = {}
-        for k, v in list(sd.items()):
-            if k in ['max_lr', 'lr_warmup_steps', 'num_steps', 'lr_decay_style', 'lr_decay_steps',
-                     'min_lr', 'start_wd', 'end_wd', 'wd_incr_style', 'wd_incr_steps']:
-                if k in ['lr_warmup_steps', 'num_steps', 'lr_decay_style', 'lr_decay_steps',
-                         'wd_incr_style', 'wd_incr_steps']:
-                    new_sd[k] = int(v.item())
-                else:
-                    new_sd[k] = v.item()
-                sd.pop(k)
+        for k in _STATE_DICT_KEYS & sd.keys():
+            v = sd.pop(k)
+            new_sd[k] = int(v.item()) if k in _INT_STATE_DICT_KEYS else v.item()
 
         max_lr_ = new_sd.get('max_lr')
         self.max_lr = self._check_and_set(self.max_lr, max_lr_,
@@ -251,6 +357,9 @@ class OptimizerParamScheduler():
 
         self.min_lr = self._check_and_set(self.min_lr, new_sd.get('min_lr'),
                                           'minimum learning rate')
+        # group lr bounds may change with max_lr and min_lr, and lrs may be overwritten together with
+        # the checkpoint, so all of them are reassigned
+        self.refresh_group_cache()
 
         lr_warmup_steps_ = new_sd.get('lr_warmup_steps')
         self.lr_warmup_steps = self._check_and_set(
@@ -272,6 +381,7 @@ class OptimizerParamScheduler():
             lr_decay_style_list[lr_decay_style_],
             'learning rate decay style'
             )
+        self._resolve_lr_decay_style()
 
         num_steps = new_sd.get('num_steps')
         self.step(increment=num_steps)
@@ -289,3 +399,6 @@ class OptimizerParamScheduler():
             self.wd_incr_style = self._check_and_set(self.wd_incr_style,
                                                      wd_incr_style_list[new_sd.get('wd_incr_style')],
                                                      "weight decay incr style")
+            self._check_wd_incr_style()
+            # wd is only applied to param groups by the next step
+            self._schedule_settled = False
@@ -565,6 +565,14 @@ class TrainOneStepCell(nn.Cell):
         self.use_mixed_precision_optimizer = isinstance(optimizer, MixedPrecisionOptimizer)
         if isinstance(optimizer, DistributedOptimizer) and optimizer.config.overlap_param_gather:
             optimizer.enable_pre_hook(network_with_loss)
+        self.wait_zero_grad_reduce = hasattr(optimizer, "wait_grad_reduce") and \
+            getattr(optimizer, "overlap_grad_reduce", False)
+        if self.wait_zero_grad_reduce and training_config.dataset_config.micro_batch_num > 1:
+            # gradients are accumulated between micro batches before returning to this cell
+            logger.warning("overlap_grad_reduce of ZeRO optimizer is not supported with micro_batch_num > 1, "
+                           "it will be disabled.")
+            optimizer.overlap_grad_reduce = False
+            self.wait_zero_grad_reduce = False
 
         if hasattr(optimizer, "parameters"):
             parameters = optimizer.parameters
@@ -645,6 +653,8 @@ class TrainOneStepCell(nn.Cell):
 
         # loss is scale and unscale in forward_backward_func
         (loss, _), grads = self.forward_backward_func(*inputs_tuple, loss_scale=current_step_loss_scale, **inputs_dict)
+        if self.wait_zero_grad_reduce:
+            self.optimizer.wait_grad_reduce()
 
         # apply grad reducer
         grads = list(grads)
@@ -199,13 +199,18 @@ class ChatGLM2Model(GLM2PreTrainedModel):
                 if attention_mask is None:
                     # (bs, 1, seq_len, seq_len)
                     full_attention_mask = self.get_masks(batch_size, seq_len, attention_mask, input_position)
-                    full_attention_mask = full_attention_mask.type(mstype.uint8)
+                    if self.use_flash_attention:
+                        # flash attention takes a uint8 mask, core attention fills scores with the bool mask as is
+                        full_attention_mask = full_attention_mask.type(mstype.uint8)
                 else:
                     if self.mask_generate == "inmap":
                         full_attention_mask = self.get_attention_mask(attention_mask)
                         full_attention_mask = F.reshape(full_attention_mask, (batch_size, 1, seq_len, seq_len))
                     else:
                         full_attention_mask = attention_mask
+            if self.mask_generate == "compress_reset":
+                # actual_seq_len for flash attention, flattened to int64 once instead of in every layer
+                full_attention_mask = self.cast(self.reshape(full_attention_mask, (-1,)), mstype.int64)
             mask = full_attention_mask
         if input_embeds is None:
             input_embeds = self.embedding(input_ids)  # (bs, seq_len, hs)
@@ -66,7 +66,8 @@ class ChatGLM2Config(PretrainedConfig):
         param_init_type (str, optional): Parameter initial dtype. Default: ``float16``.
         compute_dtype (str, optional): Linear layer compute dtype. Default: ``float16``.
         layernorm_compute_type (str, optional): LayerNorm compute dtype. Default: ``float32``.
-        residual_dtype (str, optional): Residual compute dtype. Default: ``float32``.
+        residual_dtype (str, optional): Residual compute dtype. Setting it to ``compute_dtype`` keeps the residual
+            stream in low precision and avoids the up-casts around each residual add. Default: ``float32``.
         rotary_dtype (str, optional): Custom rotary position embedding compute dtype. Default: ``None``.
         use_past (bool, optional): Whether the model should use the past last key/values attentions (if applicable to
             the model) to speed up decoding. Default: ``False``.
@@ -13,6 +13,7 @@
 # limitations under the License.
 # ============================================================================
 """ChatGLM2 Modules."""
+from functools import lru_cache
 from typing import Tuple
 import numpy as np
 
@@ -418,15 +419,63 @@ class ChatGLM2RotaryEmbedding(nn.Cell):
             self.k_mul.shard((kv_strategy, (cp, 1, 1)))
 
 
+class ChatGLM2BiasSoftmax(nn.Cell):
+    """ChatGLM2 softmax over the masked attention scores.
+
+    Keeps the mask fill, the optional fp32 up-cast and the softmax in one cell with matching
+    shard strategies, so the score tensor is not redistributed between them and the graph
+    kernel fusion pass sees them as one subgraph.
+    """
+    def __init__(self, softmax_in_fp32=True):
+        super(ChatGLM2BiasSoftmax, self).__init__()
+        self.softmax_in_fp32 = softmax_in_fp32
+        # finite fill value, -inf would turn fully masked rows into NaN
+        self.mask_value = Tensor(-10000, dtype=mstype.float32)
+        self.masked_fill = P.MaskedFill()
+        self.cast = P.Cast()
+        self.mask_cast = P.Cast()
+        self.softmax = P.Softmax(axis=-1)
+
+    def construct(self, attention_scores, attention_mask=None):
+        """construct"""
+        # attention_scores: [bs, n_head, seq_q, seq_k], attention_mask: [bs, 1, seq_q, seq_k]
+        scores_dtype = attention_scores.dtype
+        if attention_mask is not None:
+            # masked positions (mask == 1) are filled in place, no additive [bs, 1, seq_q, seq_k] bias is built
+            attention_mask = self.mask_cast(attention_mask, mstype.bool_)
+            attention_scores = self.masked_fill(attention_scores, attention_mask,
+                                                F.cast(self.mask_value, scores_dtype))
+        if not self.softmax_in_fp32 or scores_dtype == mstype.float32:
+            # softmax already runs in the score dtype, no round trip through fp32
+            return self.softmax(attention_scores)
+        attention_scores = self.cast(attention_scores, mstype.float32)
+        attention_probs = self.softmax(attention_scores)
+        return self.cast(attention_probs, scores_dtype)
+
+    def shard(self, strategy):
+        """shard"""
+        dp = strategy[0]
+        self.mask_cast.shard(((dp, 1, 1, 1),))
+        self.masked_fill.shard((strategy, (dp, 1, 1, 1), ()))
+        self.cast.shard((strategy,))
+        self.softmax.shard((strategy,))
+
+
+@lru_cache()
+def _compress_mask(mask_length):
+    """upper triangular uint8 mask, built once and shared by every layer using the same length"""
+    tril_dev = np.tril(np.ones((mask_length, mask_length), dtype=np.int8))
+    attention_mask = np.ones((mask_length, mask_length), dtype=np.int8)
+    attention_mask = attention_mask - tril_dev
+    return Tensor(attention_mask, dtype=mstype.uint8)
+
+
 class GetCompressMask(nn.Cell):
     """Get Compress Mask"""
     def __init__(self, mask_length):
         super(GetCompressMask, self).__init__()
         self.mask_length = mask_length
-        tril_dev = np.tril(np.ones((self.mask_length, self.mask_length), dtype=np.int8))
-        attention_mask = np.ones((self.mask_length, self.mask_length), dtype=np.int8)
-        attention_mask = attention_mask - tril_dev
-        self.attention_mask = Tensor(attention_mask, dtype=mstype.uint8)
+        self.attention_mask = _compress_mask(mask_length)
         self.cast = P.Cast()
 
     # pylint: disable=W0613
@@ -13,8 +13,8 @@
 # limitations under the License.
 # ============================================================================
 """ChatGLM2 Transformer."""
-import copy
 import math
+from collections import namedtuple
 from typing import Tuple
 
 import mindspore.ops.functional as F
@@ -31,7 +31,18 @@ from mindformers.version_control import get_dropout
 from mindformers.tools.logger import logger
 
 from .glm2_config import ChatGLM2Config
-from .glm2_modules import ChatGLM2MLP, ChatGLM2RMSNorm, GetCompressMask, ChatGLM2RotaryEmbedding, GetEodResetMask
+from .glm2_modules import ChatGLM2MLP, ChatGLM2RMSNorm, GetCompressMask, ChatGLM2RotaryEmbedding, GetEodResetMask, \
+    ChatGLM2BiasSoftmax
+
+
+class _FlashAttentionShardConfig(namedtuple("_FlashAttentionShardConfig",
+                                            ["data_parallel", "model_parallel", "context_parallel"])):
+    """Parallel sizes read by FlashAttention.shard, with the ulysses split already folded into model_parallel."""
+    __slots__ = ()
+
+    def get_ulysses_cp_num(self):
+        """get ulysses context parallel num, already applied to model_parallel"""
+        return 1
 
 
 class CoreAttention(nn.Cell):
@@ -49,13 +60,13 @@ class CoreAttention(nn.Cell):
 
         self.n_head = config.num_attention_heads
         self.norm_factor = math.sqrt(self.head_dim)
-        self.mul_mask = P.Mul()
-        self.add = P.Add()
+        self.inv_norm_factor = Tensor(1.0 / self.norm_factor, dtype=config.compute_dtype)
 
         # Strided linear layer.
         self.attention_dropout = get_dropout(config.attention_dropout)
 
         parallel_config = config.parallel_config
+        self.attention_dropout.dropout.shard(((parallel_config.data_parallel, parallel_config.model_parallel, 1, 1),))
 
         self.batch_matmul_q_k = P.BatchMatMul(transpose_b=True)
         self.batch_matmul_q_k.shard(
@@ -64,7 +75,9 @@ class CoreAttention(nn.Cell):
         self.batch_matmul = P.BatchMatMul().shard(
             ((parallel_config.data_parallel, parallel_config.model_parallel, 1, 1),
              (parallel_config.data_parallel, parallel_config.model_parallel, 1, 1)))
-        self.softmax = nn.Softmax(axis=-1)
+        self.mul_query = P.Mul().shard(((parallel_config.data_parallel, parallel_config.model_parallel, 1, 1), ()))
+        self.bias_softmax = ChatGLM2BiasSoftmax(softmax_in_fp32=self.attention_softmax_in_fp32)
+        self.bias_softmax.shard((parallel_config.data_parallel, parallel_config.model_parallel, 1, 1))
 
         self.merger_head_transpose = P.Transpose().shard(
             ((parallel_config.data_parallel, parallel_config.model_parallel, 1, 1),))
@@ -72,10 +85,15 @@ class CoreAttention(nn.Cell):
 
         self.compute_dtype = config.compute_dtype
         self.multi_query_attention = config.multi_query_attention
+        self.n_kv_head = self.n_head
         if self.multi_query_attention:
             self.n_kv_head = config.multi_query_group_num
             self.qkv_hidden_size = (
                 projection_size + 2 * self.head_dim * config.multi_query_group_num)
+        self.n_rep = self.n_head // self.n_kv_head
+        # fold the query heads of each group into the sequence axis so every kv head is broadcast inside
+        # the batch matmuls instead of being tiled n_rep times; the kv heads must split over model_parallel
+        self.group_query = self.n_rep > 1 and self.n_kv_head % parallel_config.model_parallel == 0
         self.transpose = P.Transpose()
         self.cast = P.Cast()
 
@@ -84,46 +102,42 @@ class CoreAttention(nn.Cell):
         calculate attention function
         """
         # query_layer [b, heads, seq, hidden_size_per_head]
-        # key_layer [b, heads, seq, hidden_size_per_head]
-        # value_layer # [bs, heads, seq_len, hidden_size_per_head]
+        # key_layer [b, heads or kv_heads if group_query, seq, hidden_size_per_head]
+        # value_layer # [bs, heads or kv_heads if group_query, seq_len, hidden_size_per_head]
 
         # seqlen, batch, head, hidden_size
 
         if self.apply_query_key_layer_scaling:
-            query_layer = query_layer / self.norm_factor
+            # scale q rather than the [b, heads, s, s] scores, it is the smaller tensor when seq > head_dim
+            query_layer = self.mul_query(query_layer, self.inv_norm_factor)
+
+        bs, _, seq_q, _ = query_layer.shape
+        if self.group_query:
+            # [b, heads, seq_q, hidden_size_per_head] -> [b, kv_heads, n_rep * seq_q, hidden_size_per_head]
+            query_layer = self.reshape(query_layer, (bs, self.n_kv_head, self.n_rep * seq_q, self.head_dim))
 
         # ===================================
         # Raw attention scores. [b, heads, s, s]
         # ===================================
         # [b, heads, seq_q, hidden_size_per_head] × [b, heads, seq_k, hidden_size_per_head]^T -> [b, heads, seq_q, seq_k]
         matmul_result = self.batch_matmul_q_k(query_layer, key_layer)
+        if self.group_query:
+            matmul_result = self.reshape(matmul_result, (bs, self.n_head, seq_q, -1))
 
-        # record original score dtype
-        attention_scores_dtype = matmul_result.dtype
         # [b, heads, seq, seq]
         attention_scores = matmul_result
 
-        if attention_mask is None and attention_scores.shape[2] == attention_scores.shape[3]:
-            attention_mask = ops.ones((attention_scores.shape[0],
-                                       1,
-                                       attention_scores.shape[2],
-                                       attention_scores.shape[3]), dtype=mstype.bool_)
-            attention_mask.tril()
-            attention_mask = ~attention_mask
-        if attention_mask is not None:
-            attention_mask = self.mul_mask(attention_mask, -10000)
-            attention_scores = self.add(attention_scores, attention_mask)
-
-        if self.attention_softmax_in_fp32:
-            attention_scores = F.cast(attention_scores, mstype.float32)
-
-        attention_probs = self.softmax(attention_scores)
-        attention_probs = F.cast(attention_probs, attention_scores_dtype)
+        # mask bias, softmax and the cast back to the score dtype
+        attention_probs = self.bias_softmax(attention_scores, attention_mask)
 
         attention_probs = self.attention_dropout(attention_probs)
 
+        if self.group_query:
+            attention_probs = self.reshape(attention_probs, (bs, self.n_kv_head, self.n_rep * seq_q, -1))
         # [bs, heads, seq_q, seq_k] x [bs, heads, seq_v, hidden_size_per_head] -> [b, heads, seq_q, hidden_size_per_head]
         context_layer = self.batch_matmul(attention_probs, value_layer)
+        if self.group_query:
+            context_layer = self.reshape(context_layer, (bs, self.n_head, seq_q, self.head_dim))
         context_layer = F.cast(context_layer, self.compute_dtype)
         context_layer = self._merge_heads(context_layer)
 
@@ -169,6 +183,9 @@ class ChatGLM2SelfAttention(nn.Cell):
         self.qkv_hidden_size = 3 * self.projection_size
         self.kv_hidden_size = self.projection_size
         self.use_rearrange_rope = config.use_rearrange_rope
+        # q.k is unchanged by permuting head_dim the same way for q and k, so the rotated halves can be
+        # concatenated instead of re-interleaved; p-tuning prefix keys are not rotated and need the original order
+        self.rope_interleave_output = isinstance(self.pre_seq_len, int) and self.pre_seq_len > 0
         self.mask_generate = config.mask_generate  # "inmap", "compress_reset"
         self.enable_high_performance = config.enable_high_performance
 
@@ -228,8 +245,9 @@ class ChatGLM2SelfAttention(nn.Cell):
         self.use_past = config.use_past
         # use_past: True
         self.infer_attention = self.init_infer_attention(config, mp, parallel_config)
-        # use_past: False
-        self.core_attention = CoreAttention(config, self.layer_number)
+        # use_past: False, the [b, heads, s, s] core attention is only needed when flash attention is off
+        if not self.use_past and not self.use_flash_attention:
+            self.core_attention = CoreAttention(config, self.layer_number)
         self.reshape = P.Reshape()
         self.stack = P.Stack(axis=-1)
         self.mul = P.Mul()
@@ -318,10 +336,9 @@ class ChatGLM2SelfAttention(nn.Cell):
     def shard_fa(self, cp, dp, mp, parallel_config):
         """shard flash attention"""
         if self.n_kv_head >= mp:
-            fa_parallel_config = copy.deepcopy(parallel_config)
-            fa_parallel_config.model_parallel = mp * self.cp_ds
-            fa_parallel_config.context_parallel = self.cp_co
-            self.flash_attention.shard(fa_parallel_config)
+            self.flash_attention.shard(_FlashAttentionShardConfig(data_parallel=dp,
+                                                                  model_parallel=mp * self.cp_ds,
+                                                                  context_parallel=self.cp_co))
         else:
             if not self.qkv_concat:
                 self.wk.weight.parallel_optimizer = False
@@ -385,25 +402,29 @@ class ChatGLM2SelfAttention(nn.Cell):
 
     def apply_rotary_pos_emb(self, x: Tensor, rotary_pos_emb: Tuple[Tensor, Tensor, Tensor]) -> Tensor:
         """apply rotary position embedding to q,k."""
-        # x: [b, heads, seq, hidden_size_per_head]
-        bs, num_heads, seq_len, _ = x.shape  # 1, 32，4, 128
+        # x: [b, seq, heads, hidden_size_per_head]
+        bs, seq_len, num_heads, _ = x.shape  # 1, 4, 32, 128
         # rope_cache: first (seq_len, kv_channels//4, 2), other (1, kv_channels//4, 2)
         _, _, rope_cache = rotary_pos_emb
         rot_dim = rope_cache.shape[-2] * 2  # kv_channels // 2
         x, x_pass = x[..., :rot_dim], x[..., rot_dim:]
         # ms not support variable sizes
         # truncate to support variable sizes
-        # [bs, nh, sq, kv_channels//4, 2]
-        xshaped = self.reshape(x, (bs, num_heads, seq_len, rot_dim // 2, 2))
-        # [bs, 1, sq, kv_channels//4, 2]
+        # [bs, sq, nh, kv_channels//4, 2]
+        xshaped = self.reshape(x, (bs, seq_len, num_heads, rot_dim // 2, 2))
+        # [bs, sq, 1, kv_channels//4, 2]
         if rope_cache.dtype == mstype.bfloat16:
             rope_cache = self.cast(rope_cache, mstype.float32)
-        rope_cache = self.reshape(rope_cache, (-1, 1, seq_len, xshaped.shape[3], 2))
+        rope_cache = self.reshape(rope_cache, (-1, seq_len, 1, xshaped.shape[3], 2))
 
-        xshaped_0, xshaped_1 = ops.split(xshaped, 1, -1)
-        rope_cache_0, rope_cache_1 = ops.split(rope_cache, 1, -1)
+        # index the pairs directly, [bs, sq, nh, kv_channels//4]
+        xshaped_0, xshaped_1 = xshaped[..., 0], xshaped[..., 1]
+        rope_cache_0, rope_cache_1 = rope_cache[..., 0], rope_cache[..., 1]
         x_out1 = self.sub(self.mul(xshaped_0, rope_cache_0), self.mul(xshaped_1, rope_cache_1))
         x_out2 = self.add(self.mul(xshaped_1, rope_cache_0), self.mul(xshaped_0, rope_cache_1))
+        if not self.rope_interleave_output:
+            # [bs, sq, nh, hidden_size_per_head]
+            return self.concat((self.cast(x_out1, x_pass.dtype), self.cast(x_out2, x_pass.dtype), x_pass))
         x_out = self.stack((x_out1, x_out2))
         x_out = self.reshape(x_out, (x_out.shape[0], x_out.shape[1], x_out.shape[2], -1))
         x_out = self.cast(x_out, x_pass.dtype)
@@ -417,9 +438,6 @@ class ChatGLM2SelfAttention(nn.Cell):
         if not isinstance(self.pre_seq_len, int) or self.pre_seq_len <= 0:
             return key_layer, value_layer, attention_mask
 
-        if not self.use_rearrange_rope:
-            key_layer = self.kv_transpose(key_layer, (0, 2, 1, 3))
-            value_layer = self.kv_transpose(value_layer, (0, 2, 1, 3))
         seq_len = key_layer.shape[2]
 
         key_layer, value_layer = Ptuning2Adapter.add_prefix(
@@ -434,9 +452,6 @@ class ChatGLM2SelfAttention(nn.Cell):
             m_cat = P.Concat(3)
             # [bs, 1, seq_len, pre_seq_len + seq_len]
             attention_mask = m_cat((prefix_mask, attention_mask))
-        if not self.use_rearrange_rope:
-            key_layer = self.kv_transpose(key_layer, (0, 2, 1, 3))
-            value_layer = self.kv_transpose(value_layer, (0, 2, 1, 3))
         return key_layer, value_layer, attention_mask
 
     def construct(self, hidden_states, attention_mask, rotary_pos_emb, batch_valid_length=None, prefix_key_value=None,
@@ -472,8 +487,7 @@ class ChatGLM2SelfAttention(nn.Cell):
             if self.use_rearrange_rope:
                 query, key = self.apply_rotary_emb(query, key, rotary_pos_emb)  # dp, mp, 1, 1
             else:
-                query = self.transpose(query, (0, 2, 1, 3))
-                key = self.kv_transpose(key, (0, 2, 1, 3))
+                # rope is applied in [bs, seq_len, heads, head_dim], the layout flash attention consumes
                 query = self.apply_rotary_pos_emb(query, rotary_pos_emb)
                 key = self.apply_rotary_pos_emb(key, rotary_pos_emb)
 
@@ -483,9 +497,6 @@ class ChatGLM2SelfAttention(nn.Cell):
                 value,
                 attention_mask
             )
-            if not self.use_rearrange_rope:
-                query = self.transpose(query, (0, 2, 1, 3))
-                key = self.kv_transpose(key, (0, 2, 1, 3))
 
             if self.use_flash_attention:
                 if self.cp_ds > 1:
@@ -496,7 +507,8 @@ class ChatGLM2SelfAttention(nn.Cell):
                     key = self.cp_transpose_kv_before(key, (0, 1, 3, 2, 4))
                     value = self.cp_transpose_kv_before(value, (0, 1, 3, 2, 4))
                 if self.mask_generate == "compress_reset":
-                    actual_seq_len = self.cast(self.reshape(attention_mask, (-1,)), mstype.int64)
+                    # ChatGLM2Model passes the actual sequence lengths already flattened to int64
+                    actual_seq_len = attention_mask
                     attention_mask = self.get_attention_mask(attention_mask)
 
                     query = self.reshape(query, (bs * seq_len, self.n_head, self.head_dim))
@@ -523,8 +535,9 @@ class ChatGLM2SelfAttention(nn.Cell):
                 query = self.transpose(query, (0, 2, 1, 3))
                 key = self.kv_transpose(key, (0, 2, 1, 3))
                 value = self.kv_transpose(value, (0, 2, 1, 3))
-                key = self._repeat_kv(key, self.n_rep)
-                value = self._repeat_kv(value, self.n_rep)
+                if not self.core_attention.group_query:
+                    key = self._repeat_kv(key, self.n_rep)
+                    value = self._repeat_kv(value, self.n_rep)
                 attention_mask = F.reshape(self.get_attention_mask(attention_mask), (bs, 1, seq_len, seq_len))
                 context_layer = self.core_attention(query, key, value, attention_mask)
 
@@ -603,6 +616,14 @@ class ChatGLM2Block(nn.Cell):
         self.dropout.dropout.recompute(False)
         self.cast.recompute(False)
 
+    def _residual_add(self, residual, x):
+        """add in residual_dtype, casting only the operands that are not already in it"""
+        if residual.dtype != self.residual_dtype:
+            residual = F.cast(residual, self.residual_dtype)
+        if x.dtype != self.residual_dtype:
+            x = F.cast(x, self.residual_dtype)
+        return self.add(residual, x)
+
     def construct(self, hidden_states, attention_mask, rotary_pos_emb, batch_valid_length=None, prefix_key_value=None,
                   block_tables=None, slot_mapping=None):
         """Forward process of the transformer layer."""
@@ -631,7 +652,7 @@ class ChatGLM2Block(nn.Cell):
             residual = hidden_states
 
         layernorm_input = self.dropout(attention_output)
-        layernorm_input = self.add(F.cast(residual, self.residual_dtype), F.cast(layernorm_input, self.residual_dtype))
+        layernorm_input = self._residual_add(residual, layernorm_input)
 
         # Layer norm post the self attention.
         layernorm_output = self.post_attention_layernorm(layernorm_input)
@@ -647,7 +668,7 @@ class ChatGLM2Block(nn.Cell):
             residual = layernorm_input
 
         output = self.dropout(mlp_output)
-        output = self.add(F.cast(residual, self.residual_dtype), F.cast(output, self.residual_dtype))
+        output = self._residual_add(residual, output)
 
         return output
 
@@ -655,6 +676,9 @@ class ChatGLM2Block(nn.Cell):
 class ChatGLM2Transformer(nn.Cell):
     """Transformer class."""
 
+    # the fine grain interleave mode is logged for the first transformer built in a process only
+    _fine_grain_interleave_logged = False
+
     def __init__(self, config: ChatGLM2Config):
         super(ChatGLM2Transformer, self).__init__()
 
@@ -670,21 +694,22 @@ class ChatGLM2Transformer(nn.Cell):
                                                                        config.parallel_config)
         is_fine_grain_interleave_partial_recompute = self._is_fine_grain_interleave_partial_recompute(config)
 
-        self.layers = nn.CellList()
         self.layer_setting = LayerSetting(config.num_layers,
                                           config.offset,
                                           config.parallel_config,
                                           config.pp_interleave_num)
-        if self.fine_grain_interleave and not is_fine_grain_interleave_partial_recompute:
-            logger.warning("GLM use fine_grain_interleave")
-        elif self.fine_grain_interleave:
-            logger.warning("GLM use fine_grain_interleave with partial recompute")
-        else:
-            logger.warning("GLM do not use fine_grain_interleave")
-        for layer_id in range(self.num_layers):
-            layer = ChatGLM2Block(config, layer_id + 1)
+        if not ChatGLM2Transformer._fine_grain_interleave_logged:
+            ChatGLM2Transformer._fine_grain_interleave_logged = True
+            if self.fine_grain_interleave and not is_fine_grain_interleave_partial_recompute:
+                logger.warning("GLM use fine_grain_interleave")
+            elif self.fine_grain_interleave:
+                logger.warning("GLM use fine_grain_interleave with partial recompute")
+            else:
+                logger.warning("GLM do not use fine_grain_interleave")
+        layers = [ChatGLM2Block(config, layer_id + 1) for layer_id in range(self.num_layers)]
+        for layer_id, layer in enumerate(layers):
             self.layer_setting(layer, layer_id)
-            self.layers.append(layer)
+        self.layers = nn.CellList(layers)
 
         dp, cp, mp = _parallel_decompose(config)
         if self.post_layer_norm:
@@ -800,21 +825,27 @@ class ChatGLM2Transformer(nn.Cell):
         if batch_valid_length is not None and isinstance(self.pre_seq_len, int):
             batch_valid_length = batch_valid_length + self.pre_seq_len
 
-        for i in range(self.num_layers):
-            prefix_key_value = None
-            if prefix_key_values is not None:
-                prefix_key_value = prefix_key_values[i]
-            layer = self.layers[i]
-
-            hidden_states = layer(
-                hidden_states,
-                attention_mask,
-                rotary_pos_emb,
-                batch_valid_length=batch_valid_length,
-                prefix_key_value=prefix_key_value,
-                block_tables=block_tables,
-                slot_mapping=slot_mapping
-            )
+        if prefix_key_values is None:
+            for layer in self.layers:
+                hidden_states = layer(
+                    hidden_states,
+                    attention_mask,
+                    rotary_pos_emb,
+                    batch_valid_length=batch_valid_length,
+                    block_tables=block_tables,
+                    slot_mapping=slot_mapping
+                )
+        else:
+            for i in range(self.num_layers):
+                hidden_states = self.layers[i](
+                    hidden_states,
+                    attention_mask,
+                    rotary_pos_emb,
+                    batch_valid_length=batch_valid_length,
+                    prefix_key_value=prefix_key_values[i],
+                    block_tables=block_tables,
+                    slot_mapping=slot_mapping
+                )
 
         # Final layer norm.
         if self.post_layer_norm:
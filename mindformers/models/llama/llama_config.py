@@ -16,8 +16,6 @@
 
 from typing import Optional, Union
 
-from mindspore._checkparam import args_type_check
-
 from mindformers.modules.transformer.moe import MoEConfig
 from mindformers.modules.transformer.transformer import default_transformer_config, \
     TransformerOpParallelConfig, default_moe_config
@@ -127,7 +125,6 @@ class LlamaConfig(PretrainedConfig):
     model_type = "llama"
     _support_list = MindFormerBook.get_config_support_list()['llama']
 
-    @args_type_check(parallel_config=(dict, TransformerOpParallelConfig))
     def __init__(self,
                  batch_size: int = 1,
                  seq_length: int = 2048,
@@ -194,6 +191,11 @@ class LlamaConfig(PretrainedConfig):
             vocab_size: int = 32000,  # defined later by tokenizer
             multiple_of: int = 256,  # make SwiGLU hidden layer size multiple of large power of 2
         """
+        if not isinstance(parallel_config, (dict, TransformerOpParallelConfig)):
+            raise TypeError(f"The type of parallel_config must be dict or TransformerOpParallelConfig, "
+                            f"but got {type(parallel_config)}.")
+        if not isinstance(moe_config, (dict, MoEConfig)):
+            raise TypeError(f"The type of moe_config must be dict or MoEConfig, but got {type(moe_config)}.")
         super(LlamaConfig, self).__init__(**kwargs)
         if isinstance(parallel_config, dict):
             parallel_config = TransformerOpParallelConfig(**parallel_config)
@@ -44,16 +44,11 @@ def convert_mstype(ms_type: str = "float16"):
     if isinstance(ms_type, mstype.Float):
         return ms_type
     ms_type = str(ms_type).lower()
-    if ms_type == "float16":
-        return mstype.float16
-    if ms_type == "float32":
-        return mstype.float32
-    if ms_type == "bfloat16":
-        return mstype.bfloat16
-    if ms_type == "int8":
-        return mstype.int8
-    raise KeyError(f"Supported data type keywords include: "
-                   f"[float16, float32, bfloat16, int8], but get {ms_type}")
+    converted_type = str_to_ms_type.get(ms_type)
+    if converted_type is None:
+        raise KeyError(f"Supported data type keywords include: "
+                       f"[float16, float32, bfloat16, int8], but get {ms_type}")
+    return converted_type
 
 
 def reverse_dict(d: dict):
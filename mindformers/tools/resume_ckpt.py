@@ -15,6 +15,8 @@
 """Get resume ckpt."""
 import json
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from mindformers.tools.logger import logger
 from mindformers.tools.utils import (
@@ -39,6 +41,7 @@ if check_in_modelarts():
     import moxing as mox
 
 NO_META = "FOUND NO META.JSON"
+MAX_IO_WORKERS = 64
 
 
 def get_resume_checkpoint(checkpoint_dir, resume_training, resume_by_meta=True, ckpt_format='ckpt'):
@@ -155,26 +158,15 @@ def get_info_from_meta(checkpoint_dir, ckpt_format='ckpt'):
     last_epoch = None
     last_step = None
     last_ckpt_file = None
-    for rank_id_tmp in range(get_real_group_size()):
-        meta_json = os.path.join(checkpoint_dir, f"rank_{rank_id_tmp}", "meta.json")
-        if not os.path.exists(meta_json):
-            logger.warning("%s is not found.", meta_json)
-            continue
-        with open(meta_json, "r") as json_file:
-            try:
-                meta_data = json.load(json_file)
-                if not meta_data:
-                    logger.warning(f"Get nothing from {json_file}.")
-                    continue
-            # pylint: disable=W0703
-            except BaseException as e:
-                logger.warning(f"load {json_file} failed due to: {str(e)}")
-                continue
-        epoch = meta_data.get("last_epoch", None)
-        step = meta_data.get("last_step", None)
-        ckpt_file = meta_data.get("last_ckpt_file", None)
-        if not check_meta_info(epoch, step, ckpt_file, meta_json, ckpt_format):
+    device_num = get_real_group_size()
+    # meta.json files usually live on shared storage, so overlap the per-rank reads.
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_IO_WORKERS, device_num))) as executor:
+        meta_infos = list(executor.map(lambda rank_id_tmp: load_meta_info(checkpoint_dir, rank_id_tmp, ckpt_format),
+                                       range(device_num)))
+    for meta_info in meta_infos:
+        if meta_info is None:
             continue
+        epoch, step, ckpt_file = meta_info
         is_last_epoch_valid = last_epoch is None or epoch < last_epoch
         is_last_step_valid = (epoch == last_epoch and step < last_step)
         if is_last_epoch_valid or is_last_step_valid:
@@ -185,6 +177,30 @@ def get_info_from_meta(checkpoint_dir, ckpt_format='ckpt'):
     return last_epoch, last_step, last_ckpt_file
 
 
+def load_meta_info(checkpoint_dir, rank_id, ckpt_format='ckpt'):
+    """Load epoch, step and ckpt file from the meta.json of rank_id, return None if it is not usable."""
+    meta_json = os.path.join(checkpoint_dir, f"rank_{rank_id}", "meta.json")
+    if not os.path.exists(meta_json):
+        logger.warning("%s is not found.", meta_json)
+        return None
+    with open(meta_json, "rb") as json_file:
+        try:
+            meta_data = json.loads(json_file.read())
+            if not meta_data:
+                logger.warning(f"Get nothing from {json_file}.")
+                return None
+        # pylint: disable=W0703
+        except BaseException as e:
+            logger.warning(f"load {json_file} failed due to: {str(e)}")
+            return None
+    epoch = meta_data.get("last_epoch", None)
+    step = meta_data.get("last_step", None)
+    ckpt_file = meta_data.get("last_ckpt_file", None)
+    if not check_meta_info(epoch, step, ckpt_file, meta_json, ckpt_format):
+        return None
+    return epoch, step, ckpt_file
+
+
 def get_resume_ckpt_list(checkpoint_dir, last_ckpt_file, rank_id, device_num, ckpt_format='ckpt'):
     """
     get ckpts suitable for resuming, where their rank numbers are intact,
@@ -194,33 +210,35 @@ def get_resume_ckpt_list(checkpoint_dir, last_ckpt_file, rank_id, device_num, ck
     ckpt_prefix = last_ckpt_file[:last_ckpt_file.rfind("-")]
     last_epoch, last_step = get_epoch_and_step_from_ckpt_name(last_ckpt_file, ckpt_format)
     original_rank = get_rank_id_from_ckpt_name(last_ckpt_file)
-    valid_ckpts = {}
-    for rank_id_tmp in range(device_num):
-        ckpt_prefix_tmp = ckpt_prefix.replace(f"rank_{original_rank}", f"rank_{rank_id_tmp}")
-        checkpoint_rank_dir = os.path.join(checkpoint_dir, f"rank_{rank_id_tmp}")
-        if not os.path.exists(checkpoint_rank_dir):
-            raise FileNotFoundError(f"{checkpoint_rank_dir} is not found!")
-        for ckpt_file in os.listdir(checkpoint_rank_dir):
+    # split once around the rank id, so the prefix of each rank is rebuilt with a join.
+    ckpt_prefix_parts = ckpt_prefix.split(f"rank_{original_rank}")
+    valid_ckpts = defaultdict(list)
+    # list the rank folders concurrently, the listings on shared storage are dominated by round trips.
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_IO_WORKERS, device_num))) as executor:
+        rank_dir_files = list(executor.map(lambda rank_id_tmp: list_checkpoint_rank_dir(checkpoint_dir, rank_id_tmp),
+                                           range(device_num)))
+    for rank_id_tmp, ckpt_files in enumerate(rank_dir_files):
+        ckpt_prefix_tmp = f"rank_{rank_id_tmp}".join(ckpt_prefix_parts)
+        for ckpt_file in ckpt_files:
             if ckpt_file.startswith(ckpt_prefix_tmp) and ckpt_file.endswith(f".{ckpt_format}"):
                 epoch, step = get_epoch_and_step_from_ckpt_name(ckpt_file, ckpt_format)
                 if epoch < last_epoch or (epoch == last_epoch and step <= last_step):
-                    key = f"{epoch}_{step}"
-                    valid_ckpts[key] = [ckpt_file] if not valid_ckpts.get(key) \
-                        else valid_ckpts[key] + [ckpt_file]
+                    valid_ckpts[(epoch, step)].append(ckpt_file)
 
     # get ckpts suitable for resuming, where their rank numbers are intact,
     # epoch and step are consistent, and the path exists.
-    resume_ckpt_list = []
-    for key in valid_ckpts:
-        if check_checkpoints_by_rank(valid_ckpts[key], device_num):
-            ckpt_file = replace_rank_id_in_ckpt_name(valid_ckpts[key][0], rank_id)
+    resume_ckpts = []
+    for key, ckpt_files in valid_ckpts.items():
+        if check_checkpoints_by_rank(ckpt_files, device_num):
+            ckpt_file = replace_rank_id_in_ckpt_name(ckpt_files[0], rank_id)
             resume_ckpt = os.path.join(checkpoint_dir, f"rank_{rank_id}", ckpt_file)
             if not os.path.exists(resume_ckpt):
                 raise FileNotFoundError(f"{resume_ckpt} is not found!")
-            resume_ckpt_list.append(resume_ckpt)
-    if not resume_ckpt_list:
+            resume_ckpts.append((key, resume_ckpt))
+    if not resume_ckpts:
         raise RuntimeError("No checkpoint could be resumed.")
-    resume_ckpt_list.sort(key=lambda x: get_epoch_and_step_from_ckpt_name(x, ckpt_format))
+    # keys are the (epoch, step) parsed while scanning, so sorting by them needs no extra parse.
+    resume_ckpt_list = [resume_ckpt for _, resume_ckpt in sorted(resume_ckpts)]
     logger.info("Find resume-able checkpoints as follow:")
     for ckpt in resume_ckpt_list:
         logger.info(ckpt)
@@ -228,21 +246,28 @@ def get_resume_ckpt_list(checkpoint_dir, last_ckpt_file, rank_id, device_num, ck
     return resume_ckpt_list
 
 
+def list_checkpoint_rank_dir(checkpoint_dir, rank_id):
+    """List the files under the rank_id folder of checkpoint_dir."""
+    checkpoint_rank_dir = os.path.join(checkpoint_dir, f"rank_{rank_id}")
+    if not os.path.exists(checkpoint_rank_dir):
+        raise FileNotFoundError(f"{checkpoint_rank_dir} is not found!")
+    return os.listdir(checkpoint_rank_dir)
+
+
 def check_checkpoints_by_rank(checkpoints, rank_size):
     """Check rank number of ckpt in checkpoints are intact."""
     if not checkpoints:
         return False
-    checkpoints.sort(key=get_rank_id_from_ckpt_name)
     rank_id_set = set(map(get_rank_id_from_ckpt_name, checkpoints))
-    if len(rank_id_set) == rank_size and max(rank_id_set) == rank_size - 1:
+    missing_rank_ids = set(range(rank_size)).difference(rank_id_set)
+    if not missing_rank_ids and len(rank_id_set) == rank_size:
         return True
 
     ori_checkpoint = checkpoints[0]
-    ori_rank_id = get_rank_id_from_ckpt_name(ori_checkpoint)
-    for i in range(rank_size):
-        if i not in rank_id_set:
-            checkpoint = ori_checkpoint.replace(f"rank_{ori_rank_id}", f"rank_{i}")
-            logger.warning("%s is not found.", checkpoint)
+    ori_checkpoint_parts = ori_checkpoint.split(f"rank_{get_rank_id_from_ckpt_name(ori_checkpoint)}")
+    for i in sorted(missing_rank_ids):
+        checkpoint = f"rank_{i}".join(ori_checkpoint_parts)
+        logger.warning("%s is not found.", checkpoint)
     return False
 
 
@@ -269,11 +294,14 @@ def check_last_timestamp_checkpoints(checkpoint_dir, ckpt_format='ckpt'):
     Verify that the prefix, epoch and step of the checkpoints from the last timestamp
     are equal across all rank folders in the checkpoint_dir directory.
     """
+    device_num = get_real_group_size()
     compared_checkpoint_name = None
     compared_original_checkpoint_name = None
-    for rank_id_tmp in range(get_real_group_size()):
+    last_checkpoints = {}
+    for rank_id_tmp in range(device_num):
         checkpoint_rank_dir = os.path.join(checkpoint_dir, f"rank_{rank_id_tmp}")
         last_checkpoint = get_last_checkpoint(checkpoint_rank_dir, ckpt_format)
+        last_checkpoints[rank_id_tmp] = last_checkpoint
         if not last_checkpoint:
             raise ValueError(f"Checkpoint not found under {checkpoint_rank_dir}.")
         if check_ckpt_file_name(last_checkpoint, ckpt_format):
@@ -284,11 +312,16 @@ def check_last_timestamp_checkpoints(checkpoint_dir, ckpt_format='ckpt'):
     if compared_checkpoint_name is None:
         # No checkpoint follows the {prefix}-{epoch}_{step} naming convention.
         return
+    if device_num == 1:
+        # The only checkpoint has been checked above, there is nothing to compare with.
+        return
 
     find_diff_ckpt = False
-    for rank_id_tmp in range(get_real_group_size()):
-        checkpoint_rank_dir = os.path.join(checkpoint_dir, f"rank_{rank_id_tmp}")
-        last_checkpoint = get_last_checkpoint(checkpoint_rank_dir)
+    for rank_id_tmp in range(device_num):
+        last_checkpoint = last_checkpoints.get(rank_id_tmp)
+        if last_checkpoint is None:
+            checkpoint_rank_dir = os.path.join(checkpoint_dir, f"rank_{rank_id_tmp}")
+            last_checkpoint = get_last_checkpoint(checkpoint_rank_dir, ckpt_format)
 
         if not check_ckpt_file_name(last_checkpoint, ckpt_format):
             logger.error(f"Find checkpoint not follow the {{prefix}}-{{epoch}}_{{step}}.{ckpt_format} "
@@ -18,6 +18,7 @@ import os
 import re
 import shutil
 import tempfile
+from functools import lru_cache
 from multiprocessing import Process
 from typing import Dict, List, Tuple, Union
 
@@ -58,6 +59,7 @@ PLOG_PATH = '/root/ascend/log'
 LOCAL_DEFAULT_PATH = os.getenv("LOCAL_DEFAULT_PATH", './output')
 LOG_DEFAULT_PATH = "./output/log"
 LAST_TRANSFORM_LOCK_PATH = "/tmp/last_transform_done.lock"
+_CKPT_RANK_ID_PATTERN = re.compile(r'_rank_(\d+)')
 
 _PROTOCOL = 'obs'
 _PROTOCOL_S3 = 's3'
@@ -592,11 +594,22 @@ def remove_folder(folder_path, rank_id=None):
             logger.info("Folder %s is removed.", folder_path)
 
 
+@lru_cache(maxsize=None)
+def _get_ckpt_epoch_step_pattern(ckpt_fmt):
+    """Get the compiled pattern matching epoch and step in a ckpt name of ckpt_fmt."""
+    return re.compile(r'-(\d+)_(\d+)\.' + ckpt_fmt)
+
+
+@lru_cache(maxsize=None)
+def _get_ckpt_file_name_pattern(ckpt_fmt):
+    """Get the compiled pattern matching a {prefix}-{epoch}_{step}.ckpt_fmt name."""
+    return re.compile(r'^[^/]+-\d+_\d+\.' + ckpt_fmt + r"$")
+
+
 def get_epoch_and_step_from_ckpt_name(ckpt_file, ckpt_fmt='ckpt'):
     """Get epoch and step from ckpt name."""
     ckpt_name = os.path.basename(ckpt_file)
-    pattern = r'-(\d+)_(\d+)\.' + ckpt_fmt
-    match = re.search(pattern, ckpt_name)
+    match = _get_ckpt_epoch_step_pattern(ckpt_fmt).search(ckpt_name)
     if match:
         epoch = int(match.group(1))
         step = int(match.group(2))
@@ -609,7 +622,7 @@ def get_epoch_and_step_from_ckpt_name(ckpt_file, ckpt_fmt='ckpt'):
 def get_rank_id_from_ckpt_name(ckpt_file):
     """Get rank id from ckpt name."""
     ckpt_name = os.path.basename(ckpt_file)
-    match = re.search(r'_rank_(\d+)', ckpt_name)
+    match = _CKPT_RANK_ID_PATTERN.search(ckpt_name)
     if match:
         rank_id = int(match.group(1))
         return rank_id
@@ -639,8 +652,7 @@ def clear_auto_trans_output():
 def check_ckpt_file_name(ckpt_file, ckpt_fmt='ckpt'):
     """Check ckpt name in the format of {prefix}-{epoch}_{step}.ckpt"""
     ckpt_name = os.path.split(ckpt_file)[1]
-    pattern = r'^[^/]+-\d+_\d+\.' + ckpt_fmt + r"$"
-    match = re.match(pattern, ckpt_name)
+    match = _get_ckpt_file_name_pattern(ckpt_fmt).match(ckpt_name)
     if match:
         return True
     return False
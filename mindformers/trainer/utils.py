@@ -697,12 +697,15 @@ def get_last_checkpoint(checkpoint_dir, ckpt_format='ckpt'):
             f"When distributed loads are sliced weights,"
             f"load_checkpoint should be a checkpoint directory containing the directory of rank_{{0-*}},"
             f"The directory structure is as follows: **checkpoint_root_dir/rank_{{0-*}}/**.{ckpt_format}")
-    output_checkpoint_path = [
-        checkpoint for checkpoint in os.listdir(checkpoint_dir)
-        if checkpoint.endswith(f'.{ckpt_format}')
-    ]
-    if not output_checkpoint_path:
-        return None
-    output_checkpoint_path = sorted(output_checkpoint_path,
-                                    key=lambda x: os.path.getmtime(os.path.join(checkpoint_dir, x)))
-    return os.path.join(checkpoint_dir, output_checkpoint_path[-1])
+    last_checkpoint = None
+    last_mtime = None
+    with os.scandir(checkpoint_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith(f'.{ckpt_format}'):
+                continue
+            mtime = entry.stat().st_mtime
+            # '>=' keeps the latest listed one among equal mtimes, as the former stable sort did.
+            if last_mtime is None or mtime >= last_mtime:
+                last_checkpoint = entry.path
+                last_mtime = mtime
+    return last_checkpoint
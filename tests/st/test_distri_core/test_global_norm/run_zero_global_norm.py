@@ -0,0 +1,93 @@
+# Copyright 2024 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+""" Test Global Norm with ZeRO. """
+
+import argparse
+import numpy as np
+
+import mindspore as ms
+import mindspore.nn as nn
+import mindspore.ops as ops
+from mindspore import Tensor, Parameter
+from mindspore.communication.management import init
+
+from mindformers.experimental.parallel_core.pynative.config import ModelParallelConfig, TrainingConfig
+from mindformers.experimental.parallel_core.pynative.parallel_state import initialize_model_parallel
+from mindformers.experimental.parallel_core.pynative.optimizer.zero import AdamW
+from mindformers.experimental.parallel_core.pynative.training.grad_handler import get_grad_process_func
+
+
+class FakeNet(nn.Cell):
+    """
+    define a net with one parameter whose gradient is reduce-scattered among data parallel ranks
+    and one parameter whose gradient is all-reduced
+    """
+    def __init__(self, weight, bias):
+        super(FakeNet, self).__init__()
+        self.weight = Parameter(Tensor(weight), name="weight")
+        self.bias = Parameter(Tensor(bias), name="bias")
+
+    def construct(self, x):
+        return ops.matmul(x, self.weight) + self.bias
+
+
+def get_global_norm(init_params, inputs, output_grad, zero_level):
+    """run backward of sum(network(inputs) * output_grad) and compute the global norm of gradients"""
+    network = FakeNet(*init_params)
+    params = network.trainable_params()
+    if zero_level is not None:
+        # the optimizer registers the hooks which reduce gradients during backward
+        params = AdamW(network=network, params=params, zero_level=zero_level, grad_allreduce_op="mean").parameters
+    training_config = TrainingConfig(parallel_config=ModelParallelConfig(zero_level=zero_level),
+                                     grad_clip_kwargs={"grad_clip_type": "ClipGlobalNorm", "clip_value": 1.0e6})
+    grad_clip_func = get_grad_process_func(training_config, params=params)
+
+    def forward_fn(inputs, output_grad):
+        return ops.sum(network(inputs) * output_grad)
+
+    grad_fn = ms.value_and_grad(forward_fn, None, params)
+    _, grads = grad_fn(Tensor(inputs), Tensor(output_grad))
+    return grad_clip_func(list(grads))
+
+
+def run_zero_global_norm(zero_level):
+    """ Test global norm of ZeRO gradients against the one without ZeRO. """
+    ms.set_context(device_target="Ascend", mode=ms.PYNATIVE_MODE, deterministic='ON')
+
+    init()
+    initialize_model_parallel()
+
+    np.random.seed(2024)
+    init_params = [np.random.normal(0, 0.02, size=(8, 5)).astype(np.float32),
+                   np.random.normal(0, 0.02, size=(5,)).astype(np.float32)]
+    # every rank feeds the same data, so the mean reduced gradients equal the local ones
+    inputs = np.random.normal(0, 1, size=(4, 8)).astype(np.float32)
+    output_grad = np.random.normal(0, 1, size=(4, 5)).astype(np.float32)
+
+    zero_norm = get_global_norm(init_params, inputs, output_grad, zero_level)
+    golden_norm = get_global_norm(init_params, inputs, output_grad, None)
+    ref_grads = [inputs.T.astype(np.float64) @ output_grad, output_grad.sum(axis=0).astype(np.float64)]
+    ref_norm = np.sqrt(sum(np.sum(grad * grad) for grad in ref_grads))
+    print(f"global norm with {zero_level}: {zero_norm}, without ZeRO: {golden_norm}, reference: {ref_norm}")
+    assert np.allclose(golden_norm, ref_norm, rtol=1e-4)
+    assert np.allclose(zero_norm, golden_norm, rtol=1e-4)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--zero_level', type=str, default="z1")
+
+    args, rest_args = parser.parse_known_args()
+    run_zero_global_norm(args.zero_level)
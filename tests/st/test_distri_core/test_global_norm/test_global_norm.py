@@ -78,3 +78,32 @@ class TestGlobalNorm:
         ret = os.system(cmd)
         os.system(f"grep -E 'ERROR|error' {sh_path}/msrun_log_global_norm_sp/worker_0.log -C 3")
         assert ret == 0, "msrun failed, please check msrun_log_global_norm_sp/worker_*.log"
+
+    @pytest.mark.level1
+    @pytest.mark.platform_arm_ascend910b_training
+    @pytest.mark.env_single
+    @pytest.mark.run(order=3)
+    def test_zero1_global_norm(self):
+        """
+        Feature: test ClipGlobalNorm with zero1
+        Description: compute global norm of gradients reduce-scattered and all-reduced by zero1 hooks
+        Expectation: global norm is the same as the one without ZeRO
+        """
+        os.environ['HCCL_BUFFSIZE'] = "1"
+        scripts_name = "run_zero_global_norm.py"
+        device_num = 2
+
+        sh_path = os.path.split(os.path.realpath(__file__))[0]
+        scripts_path = os.path.join(sh_path, scripts_name)
+
+        scripts_cmd = f"{scripts_path} --zero_level z1"
+        cmd = f"msrun --worker_num={device_num} " + \
+              f"--local_worker_num={device_num} " + \
+              f"--master_port=8148 " + \
+              f"--log_dir=msrun_log_zero1_global_norm " + \
+              f"--join=True " + \
+              f"--cluster_time_out=300 " + \
+              f"{scripts_cmd}"
+        ret = os.system(cmd)
+        os.system(f"grep -E 'ERROR|error' {sh_path}/msrun_log_zero1_global_norm/worker_0.log -C 3")
+        assert ret == 0, "msrun failed, please check msrun_log_zero1_global_norm/worker_*.log"
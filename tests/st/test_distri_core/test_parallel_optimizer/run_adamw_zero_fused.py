@@ -0,0 +1,154 @@
+# Copyright 2024 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""run zero adamw with and without the fused AdamWeightDecay kernel"""
+
+import argparse
+
+import numpy as np
+import mindspore as ms
+import mindspore.nn as nn
+import mindspore.ops as ops
+from mindspore import Tensor, Parameter
+from mindspore.communication.management import init
+
+from mindformers.experimental.parallel_core.pynative.parallel_state import initialize_model_parallel
+from mindformers.experimental.parallel_core.pynative.optimizer.zero import AdamW
+
+ms.set_context(device_target="Ascend", mode=ms.PYNATIVE_MODE, deterministic='ON')
+
+LEARNING_RATE = 1e-2
+BETAS = (0.9, 0.999)
+EPS = 1e-8
+WEIGHT_DECAY = 0.1
+# lr and weight decay of the bias group when parameters are grouped
+BIAS_LEARNING_RATE = 5e-3
+BIAS_WEIGHT_DECAY = 0.0
+STEPS = 3
+TOLERANCE = {
+    ms.float32: dict(rtol=1e-5, atol=1e-6),
+    ms.float16: dict(rtol=1e-3, atol=1e-3),
+}
+
+
+class FakeNet(nn.Cell):
+    """
+    define a net with one parameter whose optimizer status is split among data parallel ranks
+    and one parameter whose status is not split
+    """
+    def __init__(self, weight, bias, param_dtype):
+        super(FakeNet, self).__init__()
+        self.weight = Parameter(Tensor(weight, dtype=param_dtype), name="weight")
+        self.bias = Parameter(Tensor(bias, dtype=param_dtype), name="bias")
+
+    def construct(self, x):
+        return ops.matmul(x, self.weight) + self.bias
+
+
+def adamw_reference(param, grad, exp_avg, exp_avg_sq, step, lr, weight_decay):
+    """numpy AdamW with bias correction and decoupled weight decay"""
+    beta1, beta2 = BETAS
+    exp_avg = beta1 * exp_avg + (1 - beta1) * grad
+    exp_avg_sq = beta2 * exp_avg_sq + (1 - beta2) * grad * grad
+    bias_correction1 = 1 - beta1 ** step
+    bias_correction2 = 1 - beta2 ** step
+    param = param * (1 - lr * weight_decay) - \
+        lr / bias_correction1 * exp_avg / (np.sqrt(exp_avg_sq / bias_correction2) + EPS)
+    return param, exp_avg, exp_avg_sq
+
+
+def build_optimizer(network, zero_level, allreduce_after_grad_accumulation, grouped, **kwargs):
+    """build zero adamw, the bias gets its own lr and weight decay if `grouped`"""
+    params = network.trainable_params()
+    if grouped:
+        params = [{'params': [network.weight], 'lr': LEARNING_RATE, 'weight_decay': WEIGHT_DECAY},
+                  {'params': [network.bias], 'lr': BIAS_LEARNING_RATE, 'weight_decay': BIAS_WEIGHT_DECAY}]
+    return AdamW(network=network, params=params, learning_rate=LEARNING_RATE, betas=BETAS, eps=EPS,
+                 weight_decay=WEIGHT_DECAY, zero_level=zero_level,
+                 allreduce_after_grad_accumulation=allreduce_after_grad_accumulation,
+                 grad_allreduce_op="mean", **kwargs)
+
+
+def train_one_step(network, optimizer, inputs, output_grad):
+    """
+    run backward of sum(network(inputs) * output_grad), gradients are reduced by the parameter hooks
+    or by the optimizer depending on its config
+    """
+    def forward_fn(inputs, output_grad):
+        return ops.sum(network(inputs) * output_grad)
+
+    grad_fn = ms.value_and_grad(forward_fn, None, optimizer.parameters)
+    _, grads = grad_fn(inputs, output_grad)
+    optimizer(grads)
+
+
+def compare_adamw_zero(zero_level, allreduce_after_grad_accumulation, grouped, param_dtype,
+                       config_a, config_b):
+    """
+    update the same parameters with two optimizer configs, and compare them with each other
+    and with the numpy reference after every step
+    """
+    np.random.seed(0)
+    init_params = [np.random.normal(0, 0.02, size=(8, 5)).astype(np.float32),
+                   np.random.normal(0, 0.02, size=(5,)).astype(np.float32)]
+    param_lrs = [LEARNING_RATE, BIAS_LEARNING_RATE if grouped else LEARNING_RATE]
+    param_wds = [WEIGHT_DECAY, BIAS_WEIGHT_DECAY if grouped else WEIGHT_DECAY]
+    net_a = FakeNet(*init_params, param_dtype)
+    net_b = FakeNet(*init_params, param_dtype)
+    optimizer_a = build_optimizer(net_a, zero_level, allreduce_after_grad_accumulation, grouped, **config_a)
+    optimizer_b = build_optimizer(net_b, zero_level, allreduce_after_grad_accumulation, grouped, **config_b)
+
+    ref_params = [param.astype(np.float64) for param in init_params]
+    ref_exp_avg = [np.zeros_like(param) for param in ref_params]
+    ref_exp_avg_sq = [np.zeros_like(param) for param in ref_params]
+    tolerance = TOLERANCE[param_dtype]
+    case = f"{zero_level}, grouped={grouped}, param_dtype={param_dtype}"
+    for step in range(1, STEPS + 1):
+        # every rank feeds the same data, so the mean reduced gradients equal the local ones
+        inputs = np.random.normal(0, 1, size=(4, 8)).astype(np.float32)
+        output_grad = np.random.normal(0, 1, size=(4, 5)).astype(np.float32)
+        for net, optimizer in ((net_a, optimizer_a), (net_b, optimizer_b)):
+            train_one_step(net, optimizer, Tensor(inputs, dtype=param_dtype), Tensor(output_grad, dtype=param_dtype))
+        ref_grads = [inputs.T.astype(np.float64) @ output_grad, output_grad.sum(axis=0).astype(np.float64)]
+        for i, grad in enumerate(ref_grads):
+            ref_params[i], ref_exp_avg[i], ref_exp_avg_sq[i] = adamw_reference(
+                ref_params[i], grad, ref_exp_avg[i], ref_exp_avg_sq[i], step, param_lrs[i], param_wds[i])
+
+        params_a = [param.astype(ms.float32).asnumpy() for param in net_a.trainable_params()]
+        params_b = [param.astype(ms.float32).asnumpy() for param in net_b.trainable_params()]
+        for param_a, param_b, ref_param in zip(params_a, params_b, ref_params):
+            assert np.allclose(param_a, param_b, **tolerance), \
+                f"{config_a} and {config_b} differ at step {step} ({case})"
+            assert np.allclose(param_a, ref_param, **tolerance), \
+                f"{config_a} differs from the reference at step {step} ({case})"
+        print(f"Step {step} | {config_a} and {config_b} match ({case})")
+
+
+def run_adamw_zero_fused(zero_level, allreduce_after_grad_accumulation):
+    """compare the fused and the unfused adamw with single and grouped lr/weight decay"""
+    init()
+    initialize_model_parallel()
+
+    for grouped in (False, True):
+        for param_dtype in (ms.float32, ms.float16):
+            compare_adamw_zero(zero_level, allreduce_after_grad_accumulation, grouped, param_dtype,
+                               dict(use_fused_kernel=True), dict(use_fused_kernel=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--zero_level', type=str, default="z1")
+    parser.add_argument('--allreduce_after_grad_accumulation', action='store_true')
+    args, rest_args = parser.parse_known_args()
+    run_adamw_zero_fused(args.zero_level, args.allreduce_after_grad_accumulation)
@@ -0,0 +1,46 @@
+# Copyright 2024 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""run zero adamw with and without overlapping the gradient reduce with backward propagation"""
+
+import argparse
+
+import mindspore as ms
+from mindspore.communication.management import init
+
+from mindformers.experimental.parallel_core.pynative.parallel_state import initialize_model_parallel
+from tests.st.test_distri_core.test_parallel_optimizer.run_adamw_zero_fused import compare_adamw_zero
+
+ms.set_context(device_target="Ascend", mode=ms.PYNATIVE_MODE, deterministic='ON')
+
+
+def run_adamw_zero_overlap(zero_level):
+    """
+    compare adamw whose parameter hooks reduce gradients asynchronously with the synchronous one,
+    gradients are only waited for by the optimizer itself
+    """
+    init()
+    initialize_model_parallel()
+
+    for grouped in (False, True):
+        for param_dtype in (ms.float32, ms.float16):
+            compare_adamw_zero(zero_level, False, grouped, param_dtype,
+                               dict(overlap_grad_reduce=True), dict(overlap_grad_reduce=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--zero_level', type=str, default="z1")
+    args, rest_args = parser.parse_known_args()
+    run_adamw_zero_overlap(args.zero_level)
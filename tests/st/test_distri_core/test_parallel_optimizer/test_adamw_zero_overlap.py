@@ -0,0 +1,66 @@
+# Copyright 2024 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""Test ZeRO AdamW overlapping the gradient reduce with backward propagation"""
+import os
+
+import pytest
+
+
+@pytest.mark.level1
+@pytest.mark.platform_arm_ascend910b_training
+@pytest.mark.env_single
+class TestAdamWZeroOverlap:
+    """A test class for testing the overlapped gradient reduce of ZeRO AdamW."""
+
+    def run_msrun(self, scripts_args, log_dir):
+        """launch run_adamw_zero_overlap.py on 2 devices with the given arguments"""
+        os.environ['HCCL_BUFFSIZE'] = "1"
+        scripts_name = "run_adamw_zero_overlap.py"
+        device_num = 2
+
+        sh_path = os.path.split(os.path.realpath(__file__))[0]
+        scripts_path = os.path.join(sh_path, scripts_name)
+
+        scripts_cmd = f"{scripts_path} {scripts_args}"
+        cmd = f"msrun --worker_num={device_num} "+\
+                    f"--local_worker_num={device_num} "+\
+                    f"--master_port=8118 "+\
+                    f"--log_dir={log_dir} "+\
+                    f"--join=True "+\
+                    f"--cluster_time_out=300 "+\
+                    f"{scripts_cmd}"
+        ret = os.system(cmd)
+        os.system(f"grep -E 'ERROR|error' {sh_path}/{log_dir}/worker_0.log -C 3")
+        assert ret == 0, f"msrun failed, please check {log_dir}/worker_*.log"
+
+    def test_adamw_zero1_overlap_grad_reduce(self):
+        """
+        Feature: AdamW overlap_grad_reduce
+        Description: with zero1, update the same parameters with gradients reduced asynchronously and
+            synchronously by the parameter hooks, with single and grouped lr/weight decay and
+            float32/float16 parameters
+        Expectation: parameters match each other and the numpy reference after every step
+        """
+        self.run_msrun("--zero_level z1", "msrun_log_adamw_zero1_overlap")
+
+    def test_adamw_zero2_overlap_grad_reduce(self):
+        """
+        Feature: AdamW overlap_grad_reduce
+        Description: with zero2, update the same parameters with gradients reduced asynchronously and
+            synchronously by the parameter hooks, with single and grouped lr/weight decay and
+            float32/float16 parameters
+        Expectation: parameters match each other and the numpy reference after every step
+        """
+        self.run_msrun("--zero_level z2", "msrun_log_adamw_zero2_overlap")
@@ -0,0 +1,159 @@
+# Copyright 2024 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""test resume ckpt"""
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from mindformers.tools.resume_ckpt import (
+    check_checkpoints_by_rank,
+    check_last_timestamp_checkpoints,
+    get_info_from_meta,
+    get_resume_ckpt_list
+)
+
+
+def make_checkpoints(checkpoint_dir, rank_ids, epoch, step, ckpt_format="ckpt", mtime=None):
+    """create empty checkpoints named llama_rank_{rank_id}-{epoch}_{step} under their rank folders."""
+    for rank_id in rank_ids:
+        rank_dir = os.path.join(checkpoint_dir, f"rank_{rank_id}")
+        os.makedirs(rank_dir, exist_ok=True)
+        ckpt_file = os.path.join(rank_dir, f"llama_rank_{rank_id}-{epoch}_{step}.{ckpt_format}")
+        with open(ckpt_file, "w"):
+            pass
+        if mtime is not None:
+            os.utime(ckpt_file, (mtime, mtime))
+
+
+def make_meta(checkpoint_dir, rank_id, epoch, step):
+    """create meta.json under the rank folder."""
+    rank_dir = os.path.join(checkpoint_dir, f"rank_{rank_id}")
+    os.makedirs(rank_dir, exist_ok=True)
+    with open(os.path.join(rank_dir, "meta.json"), "w") as json_file:
+        json.dump({"last_epoch": epoch, "last_step": step,
+                   "last_ckpt_file": f"llama_rank_{rank_id}-{epoch}_{step}.ckpt"}, json_file)
+
+
+class TestGetInfoFromMeta:
+    """A test class for testing get_info_from_meta."""
+
+    @mock.patch('mindformers.tools.resume_ckpt.get_real_group_size')
+    def test_minimum_among_ranks(self, mock_get_real_group_size, tmp_path):
+        """test the minimum epoch and step among all meta.json are returned."""
+        mock_get_real_group_size.return_value = 3
+        make_meta(tmp_path, 0, 2, 4)
+        make_meta(tmp_path, 1, 2, 2)
+        make_meta(tmp_path, 2, 3, 1)
+
+        assert get_info_from_meta(tmp_path) == (2, 2, "llama_rank_1-2_2.ckpt")
+
+    @mock.patch('mindformers.tools.resume_ckpt.get_real_group_size')
+    def test_invalid_meta_skipped(self, mock_get_real_group_size, tmp_path):
+        """test missing, empty and malformed meta.json are skipped."""
+        mock_get_real_group_size.return_value = 4
+        make_meta(tmp_path, 0, 1, 8)
+        os.makedirs(os.path.join(tmp_path, "rank_1"))
+        with open(os.path.join(tmp_path, "rank_1", "meta.json"), "w") as json_file:
+            json_file.write("{}")
+        os.makedirs(os.path.join(tmp_path, "rank_2"))
+        with open(os.path.join(tmp_path, "rank_2", "meta.json"), "w") as json_file:
+            json_file.write("not a json")
+
+        assert get_info_from_meta(tmp_path) == (1, 8, "llama_rank_0-1_8.ckpt")
+
+    @mock.patch('mindformers.tools.resume_ckpt.get_real_group_size')
+    def test_no_device(self, mock_get_real_group_size, tmp_path):
+        """test nothing is returned when there is no device."""
+        mock_get_real_group_size.return_value = 0
+
+        assert get_info_from_meta(tmp_path) == (None, None, None)
+
+
+class TestGetResumeCkptList:
+    """A test class for testing get_resume_ckpt_list."""
+
+    def test_intact_checkpoints_sorted(self, tmp_path):
+        """test only the checkpoints intact across ranks and not later than the last one are returned in order."""
+        make_checkpoints(tmp_path, [0, 1], 1, 4)
+        make_checkpoints(tmp_path, [0, 1], 1, 2)
+        make_checkpoints(tmp_path, [0], 1, 3)
+        make_checkpoints(tmp_path, [0, 1], 2, 1)
+
+        resume_ckpt_list = get_resume_ckpt_list(str(tmp_path), "llama_rank_0-1_4.ckpt", 1, 2)
+
+        assert resume_ckpt_list == [os.path.join(str(tmp_path), "rank_1", "llama_rank_1-1_2.ckpt"),
+                                    os.path.join(str(tmp_path), "rank_1", "llama_rank_1-1_4.ckpt")]
+
+    def test_no_resumable_checkpoint(self, tmp_path):
+        """test RuntimeError is raised if no checkpoint is intact across ranks."""
+        make_checkpoints(tmp_path, [0], 1, 2)
+        make_checkpoints(tmp_path, [1], 1, 3)
+
+        with pytest.raises(RuntimeError, match="No checkpoint could be resumed"):
+            get_resume_ckpt_list(str(tmp_path), "llama_rank_0-1_2.ckpt", 0, 2)
+
+    def test_missing_rank_folder(self, tmp_path):
+        """test FileNotFoundError is raised if a rank folder is missing."""
+        make_checkpoints(tmp_path, [0], 1, 2)
+
+        with pytest.raises(FileNotFoundError, match="rank_1"):
+            get_resume_ckpt_list(str(tmp_path), "llama_rank_0-1_2.ckpt", 0, 2)
+
+
+class TestCheckCheckpointsByRank:
+    """A test class for testing check_checkpoints_by_rank."""
+
+    def test_intact(self):
+        assert check_checkpoints_by_rank(["llama_rank_1-1_2.ckpt", "llama_rank_0-1_2.ckpt"], 2)
+
+    def test_missing_rank(self):
+        assert not check_checkpoints_by_rank(["llama_rank_0-1_2.ckpt", "llama_rank_2-1_2.ckpt"], 3)
+
+    def test_empty(self):
+        assert not check_checkpoints_by_rank([], 2)
+
+
+class TestCheckLastTimestampCheckpoints:
+    """A test class for testing check_last_timestamp_checkpoints."""
+
+    @mock.patch('mindformers.tools.resume_ckpt.get_real_group_size')
+    def test_consistent_checkpoints_with_format(self, mock_get_real_group_size, tmp_path):
+        """test newer checkpoints of another format are ignored on every rank."""
+        mock_get_real_group_size.return_value = 2
+        make_checkpoints(tmp_path, [0, 1], 1, 2, ckpt_format="safetensors", mtime=1000)
+        make_checkpoints(tmp_path, [1], 1, 4, ckpt_format="ckpt", mtime=2000)
+
+        check_last_timestamp_checkpoints(str(tmp_path), "safetensors")
+
+    @mock.patch('mindformers.tools.resume_ckpt.get_real_group_size')
+    def test_inconsistent_checkpoints(self, mock_get_real_group_size, tmp_path):
+        """test ValueError is raised if the last checkpoints of ranks differ."""
+        mock_get_real_group_size.return_value = 2
+        make_checkpoints(tmp_path, [0, 1], 1, 2, ckpt_format="safetensors", mtime=1000)
+        make_checkpoints(tmp_path, [1], 1, 4, ckpt_format="safetensors", mtime=2000)
+
+        with pytest.raises(ValueError, match="Find 2 different checkpoints name"):
+            check_last_timestamp_checkpoints(str(tmp_path), "safetensors")
+
+    @mock.patch('mindformers.tools.resume_ckpt.get_real_group_size')
+    def test_missing_checkpoint(self, mock_get_real_group_size, tmp_path):
+        """test ValueError is raised if a rank folder has no checkpoint."""
+        mock_get_real_group_size.return_value = 1
+        os.makedirs(os.path.join(tmp_path, "rank_0"))
+
+        with pytest.raises(ValueError, match="Checkpoint not found"):
+            check_last_timestamp_checkpoints(str(tmp_path))